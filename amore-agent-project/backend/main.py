@@ -1,11 +1,14 @@
 import sys
 import os
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel
 from typing import Dict, Any, List, Optional
 import uvicorn
 import json
+import asyncio
 
 # -------------------------------------------------------------------------
 # Path Setup
@@ -14,14 +17,80 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(current_dir)
 
 from services.crm_agent.orchestrator import get_orchestrator
+from services.crm_agent.data_loader import get_data_loader
+from services.product_agent.retriever import get_retriever
+from services.regulation_agent.compliance import get_compliance_agent
+from services.regulation_agent.config import BATCH_MAX_MESSAGES
+from services.regulation_agent.data_loader import get_regulation_dbs
+from utils.hot_reload import start_watchers, stop_watchers
+from utils.llm_factory import get_llm_client
 
 # -------------------------------------------------------------------------
-# Initialize
+# Initialize (background warm-up; /ready reports when it is done)
 # -------------------------------------------------------------------------
-print("Initializing Orchestrator...")
-orch = get_orchestrator()
+# Backoff between warm-up attempts (seconds): base, doubled per failure up to max
+WARMUP_RETRY_BASE_DELAY = float(os.getenv("WARMUP_RETRY_BASE_DELAY", "1"))
+WARMUP_RETRY_MAX_DELAY = float(os.getenv("WARMUP_RETRY_MAX_DELAY", "30"))
 
-app = FastAPI(title="Amore Agent API")
+readiness = {
+    "ready": False,
+    "error": None,      # Last warm-up failure (cleared once ready)
+    "attempts": 0,
+    "components": {},   # component -> load seconds
+    "deferred": {},     # agent -> error; not gating, loaded lazily on first request instead
+}
+
+async def _load(name: str, loader):
+    """Run a blocking subsystem loader in a worker thread and record how long it took."""
+    started = time.perf_counter()
+    result = await asyncio.to_thread(loader)
+    readiness["components"][name] = round(time.perf_counter() - started, 2)
+    print(f"[Startup] {name} ready ({readiness['components'][name]}s)")
+    return result
+
+async def warm_up():
+    # 1. Local data (readiness gate): independent -> parallel threads, retried with backoff
+    delay = WARMUP_RETRY_BASE_DELAY
+    while True:
+        readiness["attempts"] += 1
+        results = await asyncio.gather(
+            _load("product_index", get_retriever),
+            _load("crm_data", get_data_loader),
+            _load("regulation_dbs", get_regulation_dbs),
+            return_exceptions=True,
+        )
+        errors = [r for r in results if isinstance(r, Exception)]
+        if not errors:
+            break
+        readiness["error"] = str(errors[0])
+        print(f"[Startup] Warm-up attempt {readiness['attempts']} failed: {errors[0]} (retrying in {delay}s)")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, WARMUP_RETRY_MAX_DELAY)
+
+    readiness["error"] = None
+    readiness["ready"] = True
+    # Rebuild product index / CRM data / regulation DBs in the background when their files change
+    start_watchers()
+    print(f"[Startup] All data warm: {readiness['components']}")
+
+    # 2. Agents (not gating: they need API config; the retrieval plan is computed on first use)
+    for name, loader in (("orchestrator", get_orchestrator), ("compliance_agent", get_compliance_agent)):
+        try:
+            await _load(name, loader)
+        except Exception as e:
+            readiness["deferred"][name] = str(e)
+            print(f"[Startup] {name} deferred to first request: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up after the server binds, so /health answers while indexes load
+    warm_task = asyncio.create_task(warm_up())
+    yield
+    warm_task.cancel()
+    stop_watchers()
+    await get_llm_client().aclose()
+
+app = FastAPI(title="Amore Agent API", lifespan=lifespan)
 
 # -------------------------------------------------------------------------
 # Models
@@ -35,6 +104,12 @@ class ChatResponse(BaseModel):
     candidates: Dict[str, Any]
     parsed: Dict[str, Any] = {}
 
+class ComplianceBatchRequest(BaseModel):
+    messages: List[str]
+
+class ComplianceBatchResponse(BaseModel):
+    results: List[Dict[str, Any]] # One verdict per message, in request order
+
 # -------------------------------------------------------------------------
 # API Endpoints
 # -------------------------------------------------------------------------
@@ -43,12 +118,13 @@ async def chat_endpoint(request: ChatRequest):
     if not request.message:
         raise HTTPException(status_code=400, detail="Message cannot be empty")
     
+    orch = get_orchestrator()
+
     async def event_generator():
         try:
-            # Iterate over the generator from orchestrator
-            # Note: process_query_stream is a synchronous generator, so we iterate normally.
-            # If it were async, we'd use async for.
-            for event in orch.process_query_stream(request.message, request.history):
+            # Iterate over the async generator from orchestrator.
+            # Every LLM/embedding call inside is awaited, so other requests keep streaming meanwhile.
+            async for event in orch.process_query_stream(request.message, request.history):
                 # Format as SSE (Server-Sent Events)
                 # data: <json>\n\n
                 json_data = json.dumps(event, ensure_ascii=False)
@@ -61,10 +137,43 @@ async def chat_endpoint(request: ChatRequest):
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
+@app.post("/compliance/batch", response_model=ComplianceBatchResponse)
+async def compliance_batch_endpoint(request: ComplianceBatchRequest):
+    if not request.messages:
+        raise HTTPException(status_code=400, detail="Messages cannot be empty")
+    if len(request.messages) > BATCH_MAX_MESSAGES:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_MESSAGES} messages per batch")
+
+    # Loading the regulation DBs is blocking; keep it off the event loop
+    agent = await asyncio.to_thread(get_compliance_agent)
+    results = await agent.check_compliance_batch(request.messages)
+    return {"results": results}
+
 @app.get("/health")
 def health_check():
+    # Liveness only: the process is up and serving
     return {"status": "ok"}
 
+@app.get("/stats")
+def stats():
+    # Token usage (cached_ratio = share of prompt tokens served from the provider's prompt cache)
+    # and hit rates of the local response / embedding / verdict caches
+    llm = get_llm_client()
+    body = {"llm_usage": llm.usage_stats(), "llm_cache": llm.cache_stats()}
+    if "compliance_agent" in readiness["components"]: # Don't trigger a DB load from a stats probe
+        agent = get_compliance_agent()
+        body["embedding_cache"] = agent.retriever.embedding_cache.stats()
+        body["verdict_cache"] = agent.verdict_cache.stats()
+    return body
+
+@app.get("/ready")
+def ready_check():
+    # Readiness: all local data (product index, CRM data, regulation DBs) is loaded (503 until then)
+    body = {"status": "ready" if readiness["ready"] else "warming_up", **readiness}
+    if readiness["error"]:
+        body["status"] = "retrying"
+    return JSONResponse(body, status_code=200 if readiness["ready"] else 503)
+
 if __name__ == "__main__":
     # Run the server
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,178 @@
+"""
+Columnar, memory-mapped customer store.
+
+`compile_customer_store` converts customer_data_final.csv into a directory of .npy columns:
+  manifest.json      format version, source fingerprint, row count, column schema, segment codes
+  customer_id.npy    fixed-width bytes, row i = customer i (the ID dictionary)
+  <numeric>.npy      int32 / float32 columns
+  <date>.npy         datetime64[D] columns
+  <text>.codes.npy   int32 codes into <text>.values.npy (dictionary-encoded strings)
+  segments.npy       uint8 bit-packed (customers x Target_Code) membership matrix
+
+`CustomerStore` maps the columns with np.load(mmap_mode="r"), so opening is O(1) in the
+number of customers and pages are only touched when a column/segment is actually read.
+
+Usage:
+    python -m services.crm_agent.customer_store   # (re)build next to the CSV
+"""
+import os
+import ast
+import json
+import shutil
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List, Optional
+from utils.fingerprint import files_sha256, files_fingerprint, is_fresh
+
+FORMAT_VERSION = 1
+ID_COLUMN = "customer_id"
+SEGMENT_COLUMN = "Target_Code"
+
+def _parse_codes(value: Any) -> List[str]:
+    if not isinstance(value, str):
+        return []
+    try:
+        # Parse string representation of list "['A', 'B']"
+        codes = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return []
+    return [c for c in codes if isinstance(c, str)] if isinstance(codes, list) else []
+
+def compile_customer_store(csv_path: str, out_dir: str) -> Dict[str, Any]:
+    """Compile the customer CSV into the columnar layout. Written to a temp dir, then swapped in."""
+    df = pd.read_csv(csv_path)
+    # Ensure column names are clean (no BOM or whitespace)
+    df.columns = df.columns.str.strip()
+
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    schema = {}
+    for col in df.columns:
+        if col == SEGMENT_COLUMN:
+            continue
+        series = df[col]
+        if series.dtype == object:
+            series = series.astype(str).str.strip()
+            if col != ID_COLUMN:
+                # Padded numeric text ("  251.0 ", blanks for missing) -> real numbers
+                numeric = pd.to_numeric(series.replace("", np.nan), errors="coerce")
+                if numeric.notna().sum() == (series != "").sum():
+                    series = numeric
+
+        if col == ID_COLUMN:
+            np.save(os.path.join(tmp_dir, "customer_id.npy"), np.char.encode(series.to_numpy().astype("U"), "utf-8"))
+            continue
+
+        if pd.api.types.is_integer_dtype(series):
+            np.save(os.path.join(tmp_dir, f"{col}.npy"), series.to_numpy(dtype=np.int32))
+            schema[col] = "int32"
+            continue
+        if pd.api.types.is_float_dtype(series):
+            np.save(os.path.join(tmp_dir, f"{col}.npy"), series.to_numpy(dtype=np.float32))
+            schema[col] = "float32"
+            continue
+
+        dates = pd.to_datetime(series, errors="coerce", format="%Y-%m-%d")
+        if dates.notna().all():
+            np.save(os.path.join(tmp_dir, f"{col}.npy"), dates.to_numpy().astype("datetime64[D]"))
+            schema[col] = "date"
+            continue
+
+        codes, values = pd.factorize(series)
+        np.save(os.path.join(tmp_dir, f"{col}.codes.npy"), codes.astype(np.int32))
+        np.save(os.path.join(tmp_dir, f"{col}.values.npy"), np.asarray(values).astype("U"))
+        schema[col] = "dict"
+
+    # Bit-packed segment membership matrix
+    rows_codes = [_parse_codes(v) for v in df.get(SEGMENT_COLUMN, pd.Series([None] * len(df)))]
+    segment_codes = sorted({c for codes in rows_codes for c in codes})
+    code_pos = {c: i for i, c in enumerate(segment_codes)}
+    membership = np.zeros((len(df), len(segment_codes)), dtype=bool)
+    for row, codes in enumerate(rows_codes):
+        for c in codes:
+            membership[row, code_pos[c]] = True
+    np.save(os.path.join(tmp_dir, "segments.npy"), np.packbits(membership, axis=1))
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "source_sha256": files_sha256([csv_path]),
+        "source_fingerprint": files_fingerprint([csv_path]),
+        "n_customers": int(len(df)),
+        "columns": schema,
+        "segment_codes": segment_codes,
+    }
+    with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return manifest
+
+def _is_fresh(csv_path: str, out_dir: str) -> bool:
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return False
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    return manifest.get("format_version") == FORMAT_VERSION and is_fresh(manifest, [csv_path])
+
+class CustomerStore:
+    """Read-only view over a compiled store. Columns are memory-mapped, segment postings cached."""
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+
+        self.n_customers = self.manifest["n_customers"]
+        self.segment_codes: List[str] = self.manifest["segment_codes"]
+        self._ids = self._load("customer_id.npy")
+        self._segments = self._load("segments.npy")
+        self._postings: Dict[str, np.ndarray] = {}
+
+        # Segment suffix ('G04_WINBACK' -> 'WINBACK') -> bit columns
+        self.suffix_columns: Dict[str, List[int]] = {}
+        for i, code in enumerate(self.segment_codes):
+            if "_" in code:
+                self.suffix_columns.setdefault(code.split("_")[-1], []).append(i)
+
+    def _load(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.store_dir, name), mmap_mode="r")
+
+    @classmethod
+    def open_or_build(cls, csv_path: str, store_dir: str) -> "CustomerStore":
+        """Open the compiled store, (re)compiling first if missing or stale vs. the CSV."""
+        if os.path.exists(csv_path) and not _is_fresh(csv_path, store_dir):
+            print(f"[Model-2] Compiling customer store -> {store_dir}")
+            compile_customer_store(csv_path, store_dir)
+        return cls(store_dir)
+
+    def column(self, name: str) -> np.ndarray:
+        kind = self.manifest["columns"].get(name)
+        if kind is None:
+            raise KeyError(name)
+        if kind == "dict":
+            return self._load(f"{name}.values.npy")[self._load(f"{name}.codes.npy")]
+        return self._load(f"{name}.npy")
+
+    def customer_ids(self, rows: Optional[np.ndarray] = None) -> List[str]:
+        ids = self._ids if rows is None else self._ids[rows]
+        return np.char.decode(ids, "utf-8").tolist()
+
+    def segment_rows(self, suffix: str) -> np.ndarray:
+        """Sorted row indices of customers in the segment (unpacks one bit column, once)."""
+        suffix = suffix.upper()
+        rows = self._postings.get(suffix)
+        if rows is None:
+            mask = np.zeros(self.n_customers, dtype=bool)
+            for col in self.suffix_columns.get(suffix, []):
+                mask |= ((self._segments[:, col // 8] >> (7 - col % 8)) & 1).astype(bool)
+            rows = np.flatnonzero(mask).astype(np.int32)
+            self._postings[suffix] = rows
+        return rows
+
+if __name__ == "__main__":
+    from services.crm_agent.data_loader import CUSTOMER_DATA_PATH, CUSTOMER_STORE_DIR
+    manifest = compile_customer_store(CUSTOMER_DATA_PATH, CUSTOMER_STORE_DIR)
+    print(f"Compiled {manifest['n_customers']} customers, {len(manifest['segment_codes'])} segment codes -> {CUSTOMER_STORE_DIR}")
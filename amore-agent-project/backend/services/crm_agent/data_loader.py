@@ -1,9 +1,12 @@
 # ... existing code ...
 import json
 import os
-import ast
-import pandas as pd
-from typing import Dict, Any, List
+import numpy as np
+from typing import Dict, Any, List, Optional
+from .customer_store import CustomerStore
+from .lookup import NameResolver
+from services.product_agent.normalize import BRAND_ALIASES
+from utils.hot_reload import HotReloader
 
 # Define Paths relative to this file
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -14,13 +17,17 @@ BRAND_VOICE_PATH = os.path.join(BACKEND_ROOT, "data", "crm_agent", "brand_voice_
 ACTION_CYCLE_PATH = os.path.join(BACKEND_ROOT, "data", "crm_agent", "action_cycle_db.json")
 PERSONA_CARDS_PATH = os.path.join(BACKEND_ROOT, "data", "crm_agent", "persona_cards.jsonl")
 CUSTOMER_DATA_PATH = os.path.join(BACKEND_ROOT, "data", "crm_agent", "customer_data_final.csv")
+# Compiled columnar copy of CUSTOMER_DATA_PATH (built on demand, see customer_store.py)
+CUSTOMER_STORE_DIR = os.path.join(BACKEND_ROOT, "data", "crm_agent", "customer_store")
 
 class DataLoader:
     def __init__(self):
         self.brand_voices = {} # New Structure
         self.action_cycles = []
         self.personas = {}
-        self.customers_df = None
+        # Memory-mapped columnar customer table with bit-packed segment matrix
+        self.customers: Optional[CustomerStore] = None
+        # Immutable once built: new data means a new DataLoader (swapped in by the HotReloader below)
         
         self._load_data()
         
@@ -51,32 +58,52 @@ class DataLoader:
         except Exception as e:
             print(f"[Model-2] Error loading brand_voice_guidelines.json: {e}")
 
-        # 5. Load Customer Data (CSV)
+        # 5. Load Customer Data (compiled columnar store, rebuilt only when the CSV changes)
         try:
             if os.path.exists(CUSTOMER_DATA_PATH):
-                self.customers_df = pd.read_csv(CUSTOMER_DATA_PATH)
-                # Ensure column names are clean (no BOM or whitespace)
-                self.customers_df.columns = self.customers_df.columns.str.strip()
+                self.customers = CustomerStore.open_or_build(CUSTOMER_DATA_PATH, CUSTOMER_STORE_DIR)
             else:
                 print(f"[Model-2] Customer data file not found at: {CUSTOMER_DATA_PATH}")
         except Exception as e:
             print(f"[Model-2] Error loading customer_data_final.csv: {e}")
 
+        self._build_lookups()
+
+    def _build_lookups(self):
+        """Hash-map resolvers so request-path lookups don't scan (see lookup.py)."""
+        self._brand_names = list(self.brand_voices.keys())
+        self._brand_resolver = NameResolver(
+            ((name, i) for i, name in enumerate(self._brand_names)), aliases=BRAND_ALIASES
+        )
+        self._persona_names = list(self.personas.keys())
+        self._persona_resolver = NameResolver((name, i) for i, name in enumerate(self._persona_names))
+
+        self._actions_by_id = {a.get("id"): a for a in self.action_cycles}
+        self._action_ids_lower = {}
+        for i, a in enumerate(self.action_cycles):
+            self._action_ids_lower.setdefault(a.get("id", "").lower(), i)
+        self._action_resolver = NameResolver(
+            (a.get(field, "").lower(), i)
+            for i, a in enumerate(self.action_cycles)
+            for field in ("stage_name", "message_goal", "name")
+        )
+
     def get_brand_voice(self, brand_name: str) -> Dict[str, Any]:
         """Find brand voice guideline by brand name."""
         if not brand_name:
             return {}
 
-        # 1. Exact match
-        if brand_name in self.brand_voices:
-            return self.brand_voices[brand_name]
-            
-        # 2. Fuzzy match
-        for b_name, b_data in self.brand_voices.items():
-            if brand_name in b_name or b_name in brand_name:
-                return b_data
-        
-        return {}
+        # 1. Exact / normalized / alias match
+        idx = self._brand_resolver.lookup(brand_name)
+        # 2. Partial match (either name contains the other), then n-gram similarity
+        if idx is None:
+            idx = self._brand_resolver.partial(brand_name)
+        if idx is None:
+            idx = self._brand_resolver.fuzzy(brand_name)
+        return self.brand_voices[self._brand_names[idx]] if idx is not None else {}
+
+    def get_action_by_id(self, action_id: str) -> Dict[str, Any]:
+        return self._actions_by_id.get(action_id, {}) if action_id else {}
 
     def get_action_info(self, purpose_query: str) -> Dict[str, Any]:
         """Find action cycle info by purpose name or stage."""
@@ -85,27 +112,16 @@ class DataLoader:
             
         # 1. Check if it's in [ID] format (e.g., "[G01_WELCOME]: ...")
         if purpose_query.strip().startswith("[") and "]" in purpose_query:
-            try:
-                # Extract ID: [G01_WELCOME] -> G01_WELCOME
-                potential_id = purpose_query.split("[")[1].split("]")[0].strip()
-                # Lookup by ID directly
-                for action in self.action_cycles:
-                    if action.get("id") == potential_id:
-                        return action
-            except:
-                pass # Fallback to normal search query if parsing fails
-
-        # Normalize
+            # Extract ID: [G01_WELCOME] -> G01_WELCOME
+            potential_id = purpose_query.split("[")[1].split("]")[0].strip()
+            if potential_id in self._actions_by_id:
+                return self._actions_by_id[potential_id]
+
+        # Normalize: query contained in stage/goal/name, or equal to the ID (first scenario wins)
         q = purpose_query.lower()
-        
-        for action in self.action_cycles:
-            stage = action.get("stage_name", "").lower()
-            goal = action.get("message_goal", "").lower()
-            name = action.get("name", "").lower()
-            a_id = action.get("id", "").lower()
-            
-            if q in stage or q in goal or q in name or q == a_id:
-                return action
+        hits = [idx for idx in (self._action_resolver.containing(q), self._action_ids_lower.get(q)) if idx is not None]
+        if hits:
+            return self.action_cycles[min(hits)]
         
         # Default: return a dummy structure if not found
         return {
@@ -120,72 +136,55 @@ class DataLoader:
         if not persona_name:
             return {}
             
-        # 1. Exact match
-        if persona_name in self.personas:
-            return self.personas[persona_name]
-            
-        # 2. Fuzzy match
-        for p_name, p_data in self.personas.items():
-            if persona_name in p_name or p_name in persona_name:
-                return p_data
-                
-        return {}
+        # 1. Exact / normalized match
+        idx = self._persona_resolver.lookup(persona_name)
+        # 2. Partial match, then n-gram similarity
+        if idx is None:
+            idx = self._persona_resolver.partial(persona_name)
+        if idx is None:
+            idx = self._persona_resolver.fuzzy(persona_name)
+        return self.personas[self._persona_names[idx]] if idx is not None else {}
+
+    def get_segment_rows(self, target_suffix: str) -> np.ndarray:
+        """Sorted customer row indices for a segment suffix (empty if unknown)."""
+        if self.customers is None or not target_suffix:
+            return np.array([], dtype=np.int32)
+        return self.customers.segment_rows(target_suffix)
 
     def filter_customers_by_target(self, target_suffix: str) -> List[str]:
         """
         Filter customers who have a Target_Code ending with information (e.g., 'WINBACK', 'SPRING').
         User requirement: In Target_Code column, codes are like 'G04_WINBACK', use 'WINBACK' to distinguish.
-        Returns a list of customer_ids.
+        Returns a list of customer_ids. Postings come from the store's bit-packed segment matrix (cached per suffix).
         """
-        if self.customers_df is None or self.customers_df.empty:
+        if self.customers is None:
             return []
-            
-        if not target_suffix:
+        return self.customers.customer_ids(self.get_segment_rows(target_suffix))
+
+    def count_customers_by_target(self, target_suffix: str) -> int:
+        return int(self.get_segment_rows(target_suffix).size)
+
+    def intersect_segments(self, *target_suffixes: str) -> List[str]:
+        """Customers belonging to ALL given segments (e.g. 'WINBACK', 'WINTER')."""
+        if self.customers is None or not target_suffixes:
             return []
-            
-        target_upper = target_suffix.upper() # Ensure case-insensitive or standardized comparison if needed
-        
-        filtered_ids = []
-        
-        for _, row in self.customers_df.iterrows():
-            target_codes_str = row.get("Target_Code", "[]")
-            customer_id = row.get("customer_id")
-            
-            if not isinstance(target_codes_str, str):
-                continue
-                
-            try:
-                # Parse string representation of list "['A', 'B']"
-                codes_list = ast.literal_eval(target_codes_str)
-                if not isinstance(codes_list, list):
-                    continue
-                
-                # Check if any code matches the suffix logic
-                # logic: code string split by '_' and last part matches target_upper? 
-                # OR code ends with f"_{target_upper}"
-                
-                match = False
-                for code in codes_list:
-                    # Example code: 'G04_WINBACK'
-                    # Split by '_' -> ['G04', 'WINBACK']
-                    if "_" in code:
-                        parts = code.split("_")
-                        if len(parts) > 1 and parts[-1] == target_upper:
-                            match = True
-                            break
-                
-                if match:
-                    filtered_ids.append(customer_id)
-                    
-            except (ValueError, SyntaxError):
-                continue
-                
-        return filtered_ids
-
-# Singleton instance
-_loader_instance = None
-def get_data_loader():
-    global _loader_instance
-    if _loader_instance is None:
-        _loader_instance = DataLoader()
-    return _loader_instance
+        rows = self.get_segment_rows(target_suffixes[0])
+        for suffix in target_suffixes[1:]:
+            rows = np.intersect1d(rows, self.get_segment_rows(suffix), assume_unique=True)
+        return self.customers.customer_ids(rows)
+
+def validate_loader(loader: DataLoader):
+    """_load_data only logs load errors; refuse to publish a loader that lost a table."""
+    empty = [name for name, table in (
+        ("action_cycles", loader.action_cycles), ("personas", loader.personas), ("brand_voices", loader.brand_voices)
+    ) if not table]
+    if empty:
+        raise ValueError(f"DataLoader has no {', '.join(empty)}")
+
+# Current snapshot; a new DataLoader is built and swapped in when a source file changes
+_loader_reloader = HotReloader(
+    "crm_data", [BRAND_VOICE_PATH, ACTION_CYCLE_PATH, PERSONA_CARDS_PATH, CUSTOMER_DATA_PATH], DataLoader,
+    validate=validate_loader
+)
+def get_data_loader() -> DataLoader:
+    return _loader_reloader.get()
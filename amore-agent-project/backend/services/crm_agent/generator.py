@@ -1,4 +1,5 @@
-from typing import Dict, Any
+import threading
+from typing import Dict, Any, AsyncIterator
 from .prompt_engine import build_prompt
 from utils.llm_factory import get_llm_client
 
@@ -7,14 +8,13 @@ class Generator:
         print("[Model-2] Initializing Generator with OpenAI Client...")
         self.client = get_llm_client()
 
-    def generate_response(self, 
-                          product_cand: Any, # ProductCandidate object from Model-1
-                          persona_name: str,
-                          action_id: str,
-                          action_purpose: str = None, # Kept for backward compatibility
-                          brand_voice: Dict[str, Any] = None, # NEW
-                          channel: str = "문자(LMS)",
-                          history: list = []) -> str:
+    def _build_generation_prompt(self,
+                                 product_cand: Any,
+                                 persona_name: str,
+                                 action_id: str,
+                                 brand_voice: Dict[str, Any] = None,
+                                 channel: str = "문자(LMS)",
+                                 history: list = []) -> str:
         
         # 1. Extract Factsheet from Candidate
         factsheet = product_cand.factsheet.dict()
@@ -41,12 +41,42 @@ class Generator:
                 history_text += f"{role.upper()}: {content}\n"
             
             full_prompt = history_text + "\n" + full_prompt
+        return full_prompt
+
+    async def generate_response(self, 
+                          product_cand: Any, # ProductCandidate object from Model-1
+                          persona_name: str,
+                          action_id: str,
+                          action_purpose: str = None, # Kept for backward compatibility
+                          brand_voice: Dict[str, Any] = None, # NEW
+                          channel: str = "문자(LMS)",
+                          history: list = []) -> str:
+        full_prompt = self._build_generation_prompt(
+            product_cand, persona_name, action_id, brand_voice, channel, history
+        )
         
         # 3. Generate (via OpenAI)
         print("[Model-2] Sending request to OpenAI (gpt-4o-mini)...")
-        return self.client.generate(prompt=full_prompt)
+        return await self.client.generate(prompt=full_prompt)
+
+    async def generate_response_stream(self,
+                          product_cand: Any,
+                          persona_name: str,
+                          action_id: str,
+                          action_purpose: str = None,
+                          brand_voice: Dict[str, Any] = None,
+                          channel: str = "문자(LMS)",
+                          history: list = []) -> AsyncIterator[str]:
+        """Same as generate_response, but yields text deltas as the model produces them."""
+        full_prompt = self._build_generation_prompt(
+            product_cand, persona_name, action_id, brand_voice, channel, history
+        )
+        
+        print("[Model-2] Streaming request to OpenAI (gpt-4o-mini)...")
+        async for delta in self.client.generate_stream(prompt=full_prompt):
+            yield delta
 
-    def refine_response(self, original_msg: str, feedback: str, feedback_detail: str) -> str:
+    async def refine_response(self, original_msg: str, feedback: str, feedback_detail: str) -> str:
         """
         Refine the message based on compliance feedback.
         """
@@ -67,9 +97,10 @@ class Generator:
         [ORIGINAL MESSAGE]
         {original_msg}
         """
-        return self.client.generate(prompt=prompt)
+        # Sampled (temperature 0.7) -> not cached, so a retry after a failed fix gets a fresh attempt
+        return await self.client.generate(prompt=prompt)
 
-    def generate_suggestions(self, original_msg: str, product_name: str, target_persona: str) -> list:
+    async def generate_suggestions(self, original_msg: str, product_name: str, target_persona: str) -> list:
         """
         Generate 3 actionable follow-up suggestions based on the generated message.
         """
@@ -96,7 +127,7 @@ class Generator:
         ["Valid Suggestion 1", "Valid Suggestion 2", "Valid Suggestion 3"]
         """
         
-        response_text = self.client.generate(prompt=prompt)
+        response_text = await self.client.generate(prompt=prompt)
         
         # Simple parsing to ensure list format
         try:
@@ -110,7 +141,7 @@ class Generator:
         except:
             return ["더 짧게 줄여줘", "톤을 부드럽게", "혜택 강조해줘"] # Fallback
 
-    def generate_general_chat(self, user_query: str) -> str:
+    async def generate_general_chat(self, user_query: str) -> str:
         """
         Handle general conversation when no product is retrieved.
         """
@@ -131,12 +162,15 @@ class Generator:
         4. Tone: Professional, polite, yet friendly (Korean).
         5. Keep it under 3 sentences.
         """
-        return self.client.generate(prompt=prompt)
+        return await self.client.generate(prompt=prompt)
 
 # Singleton
 _gen_instance = None
+_gen_lock = threading.Lock()
 def get_generator():
     global _gen_instance
     if _gen_instance is None:
-        _gen_instance = Generator()
+        with _gen_lock:
+            if _gen_instance is None:
+                _gen_instance = Generator()
     return _gen_instance
@@ -1,48 +1,115 @@
+import os
 import json
+import threading
 from typing import List, Dict, Any
 from utils.llm_factory import get_llm_client
 from .data_loader import get_data_loader
-from difflib import get_close_matches
+from .rule_parser import RuleIntentParser
+from utils.fuzzy_index import NgramIndex
+
+# Rule-based extraction at or above this confidence skips the LLM call
+FAST_PATH_THRESHOLD = float(os.getenv("INTENT_FAST_PATH_THRESHOLD", "0.8"))
+
+# Static instructions first: together with the persona/action lists they form a prompt prefix
+# that is identical across calls (until the data reloads), so provider-side prompt caching applies.
+SYSTEM_PROMPT_TEMPLATE = """
+Analyze the user request and map it to the provided Persona list and Action Scenario list.
+
+Task:
+1. Extract 'product' name.
+2. Identify the best matching 'persona' from the Persona List below.
+3. Identify the best matching 'action_id' from the Action Scenario List below. (e.g., G01_WELCOME, G05_WINTER)
+4. Summarize the 'purpose' (intent).
+
+Return ONLY a JSON object: {{"product": "String", "selected_persona": "Exact Name", "selected_action_id": "ID", "purpose": "String"}}
+
+[Persona List]
+{persona_context}
+
+[Action Scenario List]
+{action_context}
+"""
 
 class IntentParser:
     def __init__(self):
         self.llm = get_llm_client()
-        self.loader = get_data_loader()
+        self._ctx = None
+        self._ctx_loader = None # Loader snapshot the context was built from
+
+    @property
+    def loader(self):
+        # Current CRM data snapshot (hot-reloaded)
+        return get_data_loader()
+
+    def _context(self, loader=None) -> Dict[str, Any]:
+        """Prompt prefix, rule parser and action lookups; rebuilt only when the loader snapshot changes."""
+        loader = loader or self.loader
+        if self._ctx is None or self._ctx_loader is not loader:
+            # 1. Prepare Persona List for Context
+            persona_context = "\n".join([f"- {name}: {pd.get('desc', '')}" for name, pd in loader.personas.items()])
+            # 2. Action List for Context
+            action_context = "\n".join([f"- {ac['id']}: {ac.get('matching_description', '')}" for ac in loader.action_cycles])
+
+            action_texts = {}
+            for action in loader.action_cycles:
+                a_id = action.get("id", "UNKNOWN")
+                desc = action.get("matching_description", action.get("name", ""))
+                # Inject situation for better manual reading if needed
+                situation = action.get("situation", "")
+                extra_context = f" [SITUATION: {situation}]" if situation else ""
+                action_texts[a_id] = f"[{a_id}]: {desc}{extra_context}"
+
+            self._ctx = {
+                "system_message": SYSTEM_PROMPT_TEMPLATE.format(persona_context=persona_context, action_context=action_context),
+                "rules": RuleIntentParser(loader.personas, loader.action_cycles),
+                "persona_names": list(loader.personas.keys()),
+                "actions_by_id": {ac["id"]: ac for ac in loader.action_cycles},
+                "action_texts": {a_id: text.lower() for a_id, text in action_texts.items()},
+                # Character n-gram indexes for fuzzy fallback (scores are shown in the UI)
+                "persona_index": NgramIndex((name, name) for name in loader.personas),
+                "action_index": NgramIndex(action_texts.items()),
+            }
+            self._ctx_loader = loader
+        return self._ctx
+
+    @property
+    def rules(self) -> RuleIntentParser:
+        return self._context()["rules"]
         
-    def parse_query(self, user_text: str) -> Dict[str, Any]:
+    def rule_parse(self, user_text: str, loader=None):
+        """Rule extraction only: (extracted, confidence). Cheap and synchronous."""
+        return self._context(loader)["rules"].parse(user_text)
+
+    def is_fast_path(self, confidence: float) -> bool:
+        return confidence >= FAST_PATH_THRESHOLD
+
+    async def parse_query(self, user_text: str, loader=None, rule_result=None) -> Dict[str, Any]:
         """
-        1. LLM Extraction: Extract target search terms.
+        0. Rule Extraction: brand / scenario / persona keywords (no LLM).
+        1. LLM Extraction: only when the rules aren't confident enough.
         2. Candidate Matching: Find Top matches in DB.
+        `loader` pins the data snapshot for the whole parse (defaults to the current one);
+        `rule_result` reuses a rule_parse() the caller already ran.
         """
-        
-        # 1. Prepare Persona List for Context
-        persona_context = "\n".join([f"- {name}: {pd.get('desc', '')}" for name, pd in self.loader.personas.items()])
-        
-        # 2. Action List for Context
-        action_context = "\n".join([f"- {ac['id']}: {ac.get('matching_description', '')}" for ac in self.loader.action_cycles])
-        
-        # 3. LLM Extraction & Matching
-        prompt = f"""
-        Analyze the user request and map it to the provided Persona list and Action Scenario list.
-        
-        [Persona List]
-        {persona_context}
+        ctx = self._context(loader)
+        extracted, confidence = rule_result or ctx["rules"].parse(user_text)
+        extracted = dict(extracted)
+        if self.is_fast_path(confidence):
+            print(f"[Model-2] Intent fast path (confidence {confidence}): {extracted}")
+            parse_mode = "rules"
+        else:
+            extracted = await self._extract_with_llm(user_text, ctx)
+            parse_mode = "llm"
+        extracted["confidence"] = confidence
+        extracted["parse_mode"] = parse_mode
+        return self._match_candidates(user_text, extracted, ctx)
 
-        [Action Scenario List]
-        {action_context}
-        
-        User Request: "{user_text}"
+    async def _extract_with_llm(self, user_text: str, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        # 3. LLM Extraction & Matching (only the request varies between calls)
+        prompt = f'User Request: "{user_text}"'
         
-        Task:
-        1. Extract 'product' name.
-        2. Identify the best matching 'persona' from the list above.
-        3. Identify the best matching 'action_id' from the Action Scenario List. (e.g., G01_WELCOME, G05_WINTER)
-        4. Summarize the 'purpose' (intent).
-        
-        Return ONLY a JSON object: {{"product": "String", "selected_persona": "Exact Name", "selected_action_id": "ID", "purpose": "String"}}
-        """
-        
-        raw_json = self.llm.generate(prompt)
+        # Deterministic extraction (temperature 0) -> cacheable for repeated requests
+        raw_json = await self.llm.generate(prompt, system_message=ctx["system_message"], temperature=0)
         # Basic cleaning
         if "```json" in raw_json:
             raw_json = raw_json.split("```json")[1].split("```")[0]
@@ -53,87 +120,58 @@ class IntentParser:
             extracted = json.loads(raw_json)
         except:
             extracted = {"product": user_text, "selected_persona": None, "selected_action_id": None, "purpose": None}
-            
-        # 3. Use LLM Selection
+        return extracted
+
+    def _match_candidates(self, user_text: str, extracted: Dict[str, Any], ctx: Dict[str, Any]) -> Dict[str, Any]:
+        # 3. Use LLM (or rule) Selection
         selected_persona = extracted.get("selected_persona")
-        top_k_personas = []
+        persona_scores = [] # [(name, score)] best first
         
-        if selected_persona and selected_persona in self.loader.personas:
-            top_k_personas = [selected_persona]
-            # Add scores for UI (Mock score)
+        if selected_persona and selected_persona in ctx["persona_names"]:
+            persona_scores = [(selected_persona, 1.0)]
             extracted["persona"] = selected_persona # For display
         else:
             # Fallback to fuzzy if LLM failed
             persona_query = extracted.get("persona") or user_text
-            fuzzy = get_close_matches(persona_query, list(self.loader.personas.keys()), n=3, cutoff=0.4)
-            top_k_personas = fuzzy
+            persona_scores = ctx["persona_index"].search(persona_query, k=3, cutoff=0.4)
         
-        if not top_k_personas:
-             top_k_personas = list(self.loader.personas.keys())[:3] # Fallback to default list
+        if not persona_scores:
+             persona_scores = [(name, 0.0) for name in ctx["persona_names"][:3]] # Fallback to default list
 
         # 5. Determine Action Candidate
         selected_id = extracted.get("selected_action_id")
         
         # Validate ID
-        valid_ids = [ac['id'] for ac in self.loader.action_cycles]
-        if selected_id and selected_id not in valid_ids:
+        if selected_id and selected_id not in ctx["actions_by_id"]:
             selected_id = None # Invalid ID from LLM
             
-        top_k_actions = []
+        action_scores = [] # [(action_id, score)] best first
         
         # Specific Action Selected by LLM?
         if selected_id:
-             for ac in self.loader.action_cycles:
-                 if ac['id'] == selected_id:
-                     desc = ac.get("matching_description", ac.get("name", ""))
-                     # UPDATE: Use Name for cleaner display, ID handles lookup
-                     display_name = ac.get("name", "")
-                     top_k_actions.append(display_name)
-                     break
+            action_scores = [(selected_id, 1.0)]
         
         # Fallback: Search by Purpose if no ID or ID was invalid
-        if not top_k_actions:
-            purpose_query = extracted.get("purpose") or ""
-            
-            all_actions_for_matching = []
-            for action in self.loader.action_cycles:
-                a_id = action.get("id", "UNKNOWN")
-                desc = action.get("matching_description", action.get("name", ""))
-                # Inject situation for better manual reading if needed
-                situation = action.get("situation", "")
-                extra_context = f" [SITUATION: {situation}]" if situation else ""
-                    
-                full_action_description = f"[{a_id}]: {desc}{extra_context}"
-                all_actions_for_matching.append(full_action_description) 
+        if not action_scores:
+            purpose_query = (extracted.get("purpose") or "").lower()
             
             if purpose_query:
-                matches = [a for a in all_actions_for_matching if purpose_query.lower() in a.lower() or a.lower() in purpose_query.lower()]
-                fuzzy = get_close_matches(purpose_query, all_actions_for_matching, n=3, cutoff=0.4)
-                # Preserving order while removing duplicates
-                raw_candidates = list(dict.fromkeys(matches + fuzzy))[:3]
+                # Containment either way counts as a full match, then n-gram similarity
+                matches = [(a_id, 1.0) for a_id, text in ctx["action_texts"].items() if purpose_query in text or text in purpose_query]
+                fuzzy = ctx["action_index"].search(purpose_query, k=3, cutoff=0.4)
+                # Preserving order while removing duplicates (keep the best score)
+                best = {}
+                for a_id, score in matches + fuzzy:
+                    best[a_id] = max(score, best.get(a_id, 0.0))
+                action_scores = list(best.items())[:3]
                 
-                # Convert to clean format: Name Only
-                for i, cand in enumerate(raw_candidates):
-                     # cand is "[ID]: Description..."
-                     if "[" in cand and "]" in cand:
-                         mid = cand.split("[")[1].split("]")[0]
-                         # Find name
-                         action_obj = next((x for x in self.loader.action_cycles if x["id"] == mid), None)
-                         if action_obj:
-                             top_k_actions.append(action_obj.get("name", ""))
-                             # Set selected_id to the top candidate if not already set
-                             if not selected_id and i == 0:
-                                 selected_id = mid
-                         else:
-                             top_k_actions.append(cand)
-                     else:
-                         top_k_actions.append(cand)
-            
-        if not top_k_actions:
-            # Fallback: Just take the first 3 actions' display names
-            # Note: action_candidates is not defined in this scope in original code, 
-            # assuming it meant listing all actions. But let's just make it empty or generic.
-            pass
+                # Set selected_id to the top candidate if not already set
+                if action_scores:
+                    selected_id = action_scores[0][0]
+
+        # UPDATE: Use Name for cleaner display, ID handles lookup
+        top_k_personas = [name for name, _ in persona_scores]
+        top_k_actions = [ctx["actions_by_id"][a_id].get("name", "") for a_id, _ in action_scores]
 
         return {
             "original_query": user_text,
@@ -142,6 +180,11 @@ class IntentParser:
                 "persona": top_k_personas,
                 "purpose": top_k_actions
             },
+            # Same order as candidates, 0-1 match scores for display
+            "candidate_scores": {
+                "persona": [score for _, score in persona_scores],
+                "purpose": [score for _, score in action_scores]
+            },
             # Map to Orchestrator expected keys
             "target_product": extracted.get("product"),
             "target_persona": extracted.get("selected_persona"), # or use selected_persona variable
@@ -151,8 +194,11 @@ class IntentParser:
 
 # Singleton
 _parser_instance = None
+_parser_lock = threading.Lock()
 def get_intent_parser():
     global _parser_instance
     if _parser_instance is None:
-        _parser_instance = IntentParser()
+        with _parser_lock:
+            if _parser_instance is None:
+                _parser_instance = IntentParser()
     return _parser_instance
@@ -0,0 +1,95 @@
+"""
+Precomputed name resolution for DataLoader lookups (brand voice, persona, action).
+
+Every request-path lookup that used to scan a dict/list with substring tests becomes
+hash-map probes:
+  exact       text -> index
+  normalized  lowercase, whitespace-free text -> index
+  alias       normalized alias -> index (e.g. BRAND_ALIASES "sulwhasoo" -> 설화수)
+  grams       character and bigram postings of every name; candidates sharing the query's
+              rarest gram are verified with `in` ("query in name", linear in the name lengths)
+  contained   substrings of the query, only at the lengths names actually have ("name in query")
+  fuzzy       character n-gram index as the last resort
+"Smallest index" keeps the first-match-wins order of the original scans.
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+from utils.fuzzy_index import NgramIndex
+
+def normalize_key(text: str) -> str:
+    return "".join(text.lower().split())
+
+def _grams(text: str) -> set:
+    # Single characters answer one-character queries; bigrams narrow everything longer
+    if len(text) < 2:
+        return set(text)
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+class NameResolver:
+    def __init__(self, entries: Iterable[Tuple[str, int]], aliases: Optional[Dict[str, str]] = None):
+        """entries: (text, index) pairs; an index may have several texts. aliases: alias -> text."""
+        self.exact: Dict[str, int] = {}
+        self.normalized: Dict[str, int] = {}
+        self.texts: List[Tuple[str, int]] = []
+        self.grams: Dict[str, List[int]] = defaultdict(list) # gram -> positions in self.texts
+        self.lengths = set()
+        self.fuzzy_index = NgramIndex()
+        self._fuzzy_ids = []
+
+        for text, idx in entries:
+            if not text:
+                continue
+            self.exact.setdefault(text, idx)
+            self.normalized.setdefault(normalize_key(text), idx)
+            self.lengths.add(len(text))
+            for gram in _grams(text) | set(text):
+                self.grams[gram].append(len(self.texts))
+            self.texts.append((text, idx))
+            self.fuzzy_index.add(str(len(self._fuzzy_ids)), text)
+            self._fuzzy_ids.append(idx)
+
+        self.aliases: Dict[str, int] = {}
+        for alias, target in (aliases or {}).items():
+            idx = self.exact.get(target)
+            if idx is not None:
+                self.aliases.setdefault(normalize_key(alias), idx)
+
+    def lookup(self, query: str) -> Optional[int]:
+        """Exact, then normalized, then alias match."""
+        if query in self.exact:
+            return self.exact[query]
+        key = normalize_key(query)
+        if key in self.normalized:
+            return self.normalized[key]
+        return self.aliases.get(key)
+
+    def containing(self, query: str) -> Optional[int]:
+        """First entry whose text contains the query."""
+        if not query:
+            return None
+        postings = [self.grams.get(gram, ()) for gram in _grams(query)]
+        best = None
+        for pos in min(postings, key=len):
+            text, idx = self.texts[pos]
+            if (best is None or idx < best) and query in text:
+                best = idx
+        return best
+
+    def contained_in(self, query: str) -> Optional[int]:
+        """First entry whose text occurs inside the query."""
+        best = None
+        for length in self.lengths:
+            for i in range(len(query) - length + 1):
+                idx = self.exact.get(query[i:i + length])
+                if idx is not None and (best is None or idx < best):
+                    best = idx
+        return best
+
+    def partial(self, query: str) -> Optional[int]:
+        """First entry where either text contains the other (the original substring scan)."""
+        hits = [idx for idx in (self.containing(query), self.contained_in(query)) if idx is not None]
+        return min(hits) if hits else None
+
+    def fuzzy(self, query: str, cutoff: float = 0.5) -> Optional[int]:
+        results = self.fuzzy_index.search(query, k=1, cutoff=cutoff)
+        return self._fuzzy_ids[int(results[0][0])] if results else None
@@ -1,240 +1,304 @@
-from typing import Dict, Any, List
+import asyncio
+import threading
+from typing import Dict, Any, List, Optional, Tuple
 # Import Modules
 from services.product_agent.retriever import get_retriever
 from services.crm_agent.generator import get_generator
 from services.crm_agent.intent_parser import get_intent_parser
 from services.crm_agent.data_loader import get_data_loader
 
+# Segment suffix -> human readable description for the target audience card
+SEGMENT_DESCRIPTIONS = {
+    "WINBACK": "최근 90일 이상 미구매 고객",
+    "WELCOME": "가입 후 첫 구매를 하지 않은 신규 고객",
+    "CART": "장바구니에 상품을 담고 결제하지 않은 고객",
+    "REPURCHASE": "재구매 시기가 도래한 기존 우수 고객",
+    "ROUTINE": "정기적으로 구매하는 루틴 고객",
+    "SPRING": "봄 시즌 상품 선호 고객",
+    "SUMMER": "여름 시즌 상품 선호 고객",
+    "AUTUMN": "가을 시즌 상품 선호 고객",
+    "WINTER": "겨울 시즌 상품 선호 고객",
+}
+
+async def _as_completed(tasks: Dict[asyncio.Task, str]):
+    """Yield (key, result) for each task in completion order."""
+    pending = set(tasks)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            yield tasks[task], task.result()
+
 class Orchestrator:
     def __init__(self):
-        self.retriever = get_retriever()
         self.generator = get_generator()
         self.parser = get_intent_parser()
-        
-    def process_query_stream(self, user_text: str, history: List[Dict[str, str]] = []):
+
+    @property
+    def retriever(self):
+        # Current product index snapshot (hot-reloaded; a request captures it once)
+        return get_retriever()
+
+    def _retrieve_with_voice(self, query: str, retriever, loader) -> Tuple[list, Dict[str, Any]]:
+        """Product retrieval + brand voice of the top product (CPU-bound, run in a thread)."""
+        product_cands = retriever.retrieve(query)
+        brand_voice_info = loader.get_brand_voice(product_cands[0].brand) if product_cands else {}
+        return product_cands, brand_voice_info
+
+    def _build_target_audience(self, target_purpose: str, loader) -> Optional[Dict[str, Any]]:
+        """Resolve the purpose to an action ID and collect the matching customer segment."""
+        # target_purpose is the Name (e.g. "신규 고객 제안"). We need to find the ID (e.g. "G01_WELCOME")
+        action_info = loader.get_action_info(target_purpose)
+        found_action_id = action_info.get("id", "")
+
+        if "_" not in found_action_id:
+            return None
+
+        # heuristic: G04_WINBACK -> suffix "WINBACK"
+        parts = found_action_id.split("_")
+        if len(parts) < 2:
+            return None
+        suffix = parts[1] # WINBACK
+
+        filtered_ids = loader.filter_customers_by_target(suffix)
+        if not filtered_ids:
+            return None
+
+        desc = f"{found_action_id} 관련 고객 세그먼트"
+        for key, text in SEGMENT_DESCRIPTIONS.items():
+            if key in suffix:
+                desc = text
+                break
+
+        return {
+            "segment_name": found_action_id,
+            "count": len(filtered_ids),
+            "description": desc,
+            "sample_ids": filtered_ids # Return all IDs for scrolling
+        }
+
+    async def _check_with_refinement(self, reg_agent, msg: str, audit_trail: list, max_retries: int):
+        """Compliance feedback loop. Yields status events; audit_trail is filled in place."""
+        final_msg = msg
+        for attempt in range(max_retries + 1): # 0 to max_retries
+            # Check Compliance
+            chk_result = await reg_agent.check_compliance(final_msg)
+
+            # Record Audit
+            audit_trail.append({
+                "attempt": attempt + 1,
+                "message": final_msg,
+                "status": chk_result["status"],
+                "feedback": chk_result["feedback"]
+            })
+
+            if chk_result["status"] == "PASS":
+                break
+
+            # If FAIL, refine (unless it's the last attempt)
+            if attempt < max_retries:
+                yield {"type": "status", "msg": f"규제 위반 발견! 수정 중입니다... ({attempt+1}/{max_retries}) 🔧"}
+
+                print(f"[Orchestrator] Attempt {attempt+1} Failed. Refining...")
+                print(f"[Orchestrator] Violation Reason: {chk_result.get('feedback', 'No details')}")
+                final_msg = await self.generator.refine_response(
+                    original_msg=final_msg,
+                    feedback=chk_result["feedback"],
+                    feedback_detail=f"Please fix the violations: {chk_result['feedback']}"
+                )
+
+    async def process_query_stream(self, user_text: str, history: List[Dict[str, str]] = []):
         """
-        Streaming Pipeline (Generator)
-        Yields dicts: {"type": "status"|"data", ...}
+        Streaming Pipeline (Async Generator)
+        Yields dicts: {"type": "status"|"data"|"delta", ...}
+        "delta" events carry draft tokens; "final_message" is the compliance-checked result.
+
+        Stages run as a small dependency DAG so latency follows the critical path:
+          parse ─> retrieval(product) ─┬─> generation ─> compliance ─> suggestions
+                                       └─> target audience ───────────────┘
+          when the rules can't extract the product, retrieval(raw text) + brand voice start
+          speculatively alongside the LLM parse;
+          the compliance agent (regulation DBs) warms up in the background.
+        Data snapshots (product index, CRM data) are captured once, so a hot reload
+        mid-request doesn't mix versions.
         """
-        
-        # 1. Parse Intent
-        yield {"type": "status", "msg": "고객님의 의도를 분석하고 있어요... 🧐"}
-        parsed = self.parser.parse_query(user_text)
-        yield {"type": "data", "key": "parsed", "value": parsed}
-        
-        # 2. Extract Fields (New IntentParser Structure)
-        # 2. Extract Fields (New IntentParser Structure)
-        # parsed = {"original_query":..., "extracted": {...}, "candidates": {...}}
-        extracted = parsed.get("extracted", {})
-        candidates = parsed.get("candidates", {})
-        
-        target_product_name = extracted.get("product")
-        
-        # Prefer candidate selection for Persona/Purpose as they are validated/matched
-        target_persona = candidates.get("persona", [])[0] if candidates.get("persona") else extracted.get("selected_persona")
-        target_purpose = candidates.get("purpose", [])[0] if candidates.get("purpose") else extracted.get("purpose")
-        
-        target_action_id = parsed.get("selected_id") # This seems unused or legacy
-        
-        # Fallback defaults if null
-        if not target_product_name or target_product_name == "null": target_product_name = None
-        if not target_persona or target_persona == "null": target_persona = "일반 고객"
-        if not target_purpose or target_purpose == "null": target_purpose = "상품 추천"
-        
-        # 2. Retrieve Products (Model-1)
-        yield {"type": "status", "msg": "적합한 상품과 혜택을 찾고 있어요... 📦"}
-        
-        # Use extracted product query or fallback to full text
-        search_q = target_product_name if target_product_name else user_text
-        product_cands = self.retriever.retrieve(search_q)
-        
-        # Serialize product candidates for UI
-        serialized_products = []
-        for p in product_cands[:3]: # Top 3
-            serialized_products.append({
-                "name": p.product_name,
-                "brand": p.brand,
-                "score": p.score,
-                "claims": p.factsheet.voice_info.key_claims
-            })
-            
-        # Send candidates data immediately
-        candidates_data = {
-            "products": serialized_products,
-            "personas": parsed["candidates"]["persona"],
-            "purposes": parsed["candidates"]["purpose"],
-            "detected_brand": "Unknown", # Will update
-            "brand_tone": "Default"      # Will update
-        }
-        
-        # 3. Generate Message (Model-2)
-        yield {"type": "status", "msg": "매력적인 메시지를 작성하고 있어요... ✍️"}
-        
-        if product_cands:
-            top_product = product_cands[0]
-            # Fetch Brand Tone/Voice for UI and Generation
-            brand_voice_info = get_data_loader().get_brand_voice(top_product.brand)
-            
-            # Update candidates with brand info and send
-            candidates_data["detected_brand"] = brand_voice_info.get("brand_name", top_product.brand)
-            
-            raw_tone = brand_voice_info.get("tone_adjectives", "Default")
-            if isinstance(raw_tone, list):
-                candidates_data["brand_tone"] = ", ".join(raw_tone)
+        from services.regulation_agent.compliance import get_compliance_agent
+
+        tasks: List[asyncio.Task] = []
+        def start(coro) -> asyncio.Task:
+            task = asyncio.create_task(coro)
+            # Tasks may end up unused/cancelled: always retrieve the outcome so a failure isn't
+            # reported as "Task exception was never retrieved"
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            tasks.append(task)
+            return task
+
+        try:
+            # 1. Parse Intent (+ speculative retrieval on the raw text)
+            yield {"type": "status", "msg": "고객님의 의도를 분석하고 있어요... 🧐"}
+            # Instant once warm; a cold start loads off the event loop
+            retriever, loader = await asyncio.to_thread(lambda: (get_retriever(), get_data_loader()))
+            rule_result = self.parser.rule_parse(user_text, loader)
+            raw_retrieval_task = None
+            if not (self.parser.is_fast_path(rule_result[1]) and rule_result[0].get("product")):
+                # The LLM will parse -> retrieve on the raw text meanwhile, in case it yields no better query
+                raw_retrieval_task = start(asyncio.to_thread(self._retrieve_with_voice, user_text, retriever, loader))
+            parsed = await self.parser.parse_query(user_text, loader=loader, rule_result=rule_result)
+            yield {"type": "data", "key": "parsed", "value": parsed}
+
+            # 2. Extract Fields (New IntentParser Structure)
+            # parsed = {"original_query":..., "extracted": {...}, "candidates": {...}}
+            extracted = parsed.get("extracted", {})
+            candidates = parsed.get("candidates", {})
+
+            target_product_name = extracted.get("product")
+
+            # Prefer candidate selection for Persona/Purpose as they are validated/matched
+            target_persona = candidates.get("persona", [])[0] if candidates.get("persona") else extracted.get("selected_persona")
+            target_purpose = candidates.get("purpose", [])[0] if candidates.get("purpose") else extracted.get("purpose")
+
+            target_action_id = parsed.get("selected_id") # This seems unused or legacy
+
+            # Fallback defaults if null
+            if not target_product_name or target_product_name == "null": target_product_name = None
+            if not target_persona or target_persona == "null": target_persona = "일반 고객"
+            if not target_purpose or target_purpose == "null": target_purpose = "상품 추천"
+
+            # 2. Retrieve Products (Model-1)
+            yield {"type": "status", "msg": "적합한 상품과 혜택을 찾고 있어요... 📦"}
+
+            # Use extracted product query or fallback to full text (possibly already running)
+            if target_product_name and target_product_name != user_text:
+                if raw_retrieval_task is not None:
+                    raw_retrieval_task.cancel() # Speculation not needed
+                product_cands, brand_voice_info = await asyncio.to_thread(self._retrieve_with_voice, target_product_name, retriever, loader)
+            elif raw_retrieval_task is not None:
+                product_cands, brand_voice_info = await raw_retrieval_task
             else:
-                candidates_data["brand_tone"] = str(raw_tone)
-            yield {"type": "data", "key": "candidates", "value": candidates_data}
-            
-            # Initial Generation
-            msg = self.generator.generate_response(
-                product_cand=top_product,
-                persona_name=target_persona,
-                action_id=target_action_id,
-                action_purpose=target_purpose, # Kept existing argument
-                brand_voice=brand_voice_info, # NEW
-                channel="문자(LMS)", # Default
-                history=history # Pass History
-            )
-            
-            # -----------------------------------------------------------------
-            # FEEDBACK LOOP (Regulation Check)
-            # -----------------------------------------------------------------
-            yield {"type": "status", "msg": "규제 위반 여부를 꼼꼼히 점검 중이에요... 👮"}
-            
-            audit_trail = []
-            final_msg = msg
-            
-            # Import Regulation Agent lazily
-            from services.regulation_agent.compliance import get_compliance_agent
-            reg_agent = get_compliance_agent()
-            
-            # max_retries = 3 -> Optimized to 1 as per user request (Zero-Shot Prevention applied)
-            max_retries = 1
-            chk_result = None
-            
-            for attempt in range(max_retries + 1): # 0 to 3
-                # Check Compliance
-                chk_result = reg_agent.check_compliance(final_msg)
-                
-                # Record Audit
-                audit_entry = {
-                    "attempt": attempt + 1,
-                    "message": final_msg,
-                    "status": chk_result["status"],
-                    "feedback": chk_result["feedback"]
-                }
-                audit_trail.append(audit_entry)
-                
-                if chk_result["status"] == "PASS":
-                    break
-                
-                # If FAIL, refine (unless it's the last attempt)
-                if attempt < max_retries:
-                    yield {"type": "status", "msg": f"규제 위반 발견! 수정 중입니다... ({attempt+1}/{max_retries}) 🔧"}
-                    
-                    print(f"[Orchestrator] Attempt {attempt+1} Failed. Refining...")
-                    print(f"[Orchestrator] Violation Reason: {chk_result.get('feedback', 'No details')}")
-                    final_msg = self.generator.refine_response(
-                        original_msg=final_msg,
-                        feedback=chk_result["feedback"],
-                        feedback_detail=f"Please fix the violations: {chk_result['feedback']}"
-                    )
-            
-            # Final Result
-            yield {"type": "data", "key": "final_message", "value": final_msg}
-            yield {"type": "data", "key": "audit_trail", "value": audit_trail}
-            
-            # -----------------------------------------------------------------
-            # DYNAMIC SUGGESTIONS (Post-Generation)
-            # -----------------------------------------------------------------
-            yield {"type": "status", "msg": "추가 제안을 생각하고 있어요... 💡"}
-            print("[Orchestrator] Calling generate_suggestions...")
-            suggestions = self.generator.generate_suggestions(
-                original_msg=final_msg,
-                product_name=top_product.product_name,
-                target_persona=target_persona
-            )
-            print(f"[Orchestrator] Yielding suggestions: {suggestions}")
-            yield {"type": "data", "key": "suggestions", "value": suggestions}
-            
-            # -----------------------------------------------------------------
-            # TARGET AUDIENCE SUGGESTION (New)
-            # -----------------------------------------------------------------
-            yield {"type": "status", "msg": "메시지를 보낼 최적의 타겟을 찾고 있어요... 🎯"}
-            
-            # 1. Resolve Action ID to find Target Code
-            # target_purpose is the Name (e.g. "신규 고객 제안"). We need to find the ID (e.g. "G01_WELCOME")
-            action_info = get_data_loader().get_action_info(target_purpose)
-            found_action_id = action_info.get("id", "")
-            
-            target_audience_data = None
-            
-            if "_" in found_action_id:
-                # heuristic: G04_WINBACK -> suffix "WINBACK"
-                parts = found_action_id.split("_")
-                if len(parts) >= 2:
-                    suffix = parts[1] # WINBACK
-                    
-                    # 2. Filter Customers
-                    filtered_ids = get_data_loader().filter_customers_by_target(suffix)
-                    
-                    if filtered_ids:
-                        count = len(filtered_ids)
-                        # description matching logic
-                        desc = f"{found_action_id} 관련 고객 세그먼트"
-                        if "WINBACK" in suffix:
-                            desc = "최근 90일 이상 미구매 고객"
-                        elif "WELCOME" in suffix:
-                            desc = "가입 후 첫 구매를 하지 않은 신규 고객"
-                        elif "CART" in suffix:
-                            desc = "장바구니에 상품을 담고 결제하지 않은 고객"
-                        elif "REPURCHASE" in suffix:
-                            desc = "재구매 시기가 도래한 기존 우수 고객"
-                        elif "ROUTINE" in suffix:
-                            desc = "정기적으로 구매하는 루틴 고객"
-                        elif "SPRING" in suffix:
-                            desc = "봄 시즌 상품 선호 고객"
-                        elif "SUMMER" in suffix:
-                            desc = "여름 시즌 상품 선호 고객"
-                        elif "AUTUMN" in suffix:
-                            desc = "가을 시즌 상품 선호 고객"
-                        elif "WINTER" in suffix:
-                            desc = "겨울 시즌 상품 선호 고객"
-                            
-                        target_audience_data = {
-                            "segment_name": found_action_id, 
-                            "count": count,
-                            "description": desc,
-                            "sample_ids": filtered_ids # Return all IDs for scrolling
-                        }
-            
-            if target_audience_data:
-                 yield {"type": "data", "key": "target_audience", "value": target_audience_data}
-
-            
-        else:
-            # 2-B. Fallback: General Conversation Mode
-            # Instead of "Sorry", generate a natural response
-            yield {"type": "status", "msg": "💬 답변을 생각하고 있어요..."}
-            
-            candidates_data["detected_brand"] = None
-            candidates_data["brand_tone"] = None
-            yield {"type": "data", "key": "candidates", "value": candidates_data}
-            
-            # Generate General Response
-            gen_response = self.generator.generate_general_chat(user_text)
-            
-            yield {"type": "data", "key": "final_message", "value": gen_response}
-            yield {"type": "data", "key": "audit_trail", "value": []}
-            
-            # Fallback suggestions for general chat
-            yield {"type": "data", "key": "suggestions", "value": ["설화수 신제품 보여줘", "마케팅 문구 추천해줘", "라네즈 이벤트 알려줘"]}
-            
-        yield {"type": "status", "msg": "완료되었습니다! ✨"}
+                product_cands, brand_voice_info = await asyncio.to_thread(self._retrieve_with_voice, user_text, retriever, loader)
+
+            # Serialize product candidates for UI
+            serialized_products = []
+            for p in product_cands[:3]: # Top 3
+                serialized_products.append({
+                    "name": p.product_name,
+                    "brand": p.brand,
+                    "score": p.score,
+                    "claims": p.factsheet.voice_info.key_claims
+                })
+
+            # Send candidates data immediately
+            candidates_data = {
+                "products": serialized_products,
+                "personas": parsed["candidates"]["persona"],
+                "purposes": parsed["candidates"]["purpose"],
+                "persona_scores": parsed.get("candidate_scores", {}).get("persona", []),
+                "purpose_scores": parsed.get("candidate_scores", {}).get("purpose", []),
+                "detected_brand": "Unknown", # Will update
+                "brand_tone": "Default"      # Will update
+            }
+
+            # 3. Generate Message (Model-2)
+            yield {"type": "status", "msg": "매력적인 메시지를 작성하고 있어요... ✍️"}
+
+            if product_cands:
+                top_product = product_cands[0]
+                # Independent of generation/compliance -> start now (only this branch shows it)
+                audience_task = start(asyncio.to_thread(self._build_target_audience, target_purpose, loader))
+                # Loading the regulation DBs overlaps with generation
+                reg_agent_task = start(asyncio.to_thread(get_compliance_agent))
+
+                # Update candidates with brand info and send
+                candidates_data["detected_brand"] = brand_voice_info.get("brand_name", top_product.brand)
+
+                raw_tone = brand_voice_info.get("tone_adjectives", "Default")
+                if isinstance(raw_tone, list):
+                    candidates_data["brand_tone"] = ", ".join(raw_tone)
+                else:
+                    candidates_data["brand_tone"] = str(raw_tone)
+                yield {"type": "data", "key": "candidates", "value": candidates_data}
+
+                # Initial Generation (streamed token by token as "delta" events)
+                draft_parts = []
+                async for delta in self.generator.generate_response_stream(
+                    product_cand=top_product,
+                    persona_name=target_persona,
+                    action_id=target_action_id,
+                    action_purpose=target_purpose, # Kept existing argument
+                    brand_voice=brand_voice_info, # NEW
+                    channel="문자(LMS)", # Default
+                    history=history # Pass History
+                ):
+                    draft_parts.append(delta)
+                    yield {"type": "delta", "key": "draft_message", "value": delta}
+                msg = "".join(draft_parts)
+
+                # -----------------------------------------------------------------
+                # FEEDBACK LOOP (Regulation Check)
+                # -----------------------------------------------------------------
+                yield {"type": "status", "msg": "규제 위반 여부를 꼼꼼히 점검 중이에요... 👮"}
+
+                audit_trail = []
+                reg_agent = await reg_agent_task
+
+                # max_retries = 3 -> Optimized to 1 as per user request (Zero-Shot Prevention applied)
+                max_retries = 1
+                async for event in self._check_with_refinement(reg_agent, msg, audit_trail, max_retries):
+                    yield event
+                final_msg = audit_trail[-1]["message"]
+
+                # Final Result
+                yield {"type": "data", "key": "final_message", "value": final_msg}
+                yield {"type": "data", "key": "audit_trail", "value": audit_trail}
+
+                # -----------------------------------------------------------------
+                # DYNAMIC SUGGESTIONS + TARGET AUDIENCE (concurrent, streamed as ready)
+                # -----------------------------------------------------------------
+                yield {"type": "status", "msg": "추가 제안과 최적의 타겟을 찾고 있어요... 💡🎯"}
+                print("[Orchestrator] Calling generate_suggestions...")
+                suggestions_task = start(self.generator.generate_suggestions(
+                    original_msg=final_msg,
+                    product_name=top_product.product_name,
+                    target_persona=target_persona
+                ))
+
+                async for key, value in _as_completed({suggestions_task: "suggestions", audience_task: "target_audience"}):
+                    if key == "suggestions":
+                        print(f"[Orchestrator] Yielding suggestions: {value}")
+                        yield {"type": "data", "key": "suggestions", "value": value}
+                    elif value:
+                        yield {"type": "data", "key": "target_audience", "value": value}
+
+            else:
+                # 2-B. Fallback: General Conversation Mode
+                # Instead of "Sorry", generate a natural response
+                yield {"type": "status", "msg": "💬 답변을 생각하고 있어요..."}
+
+                candidates_data["detected_brand"] = None
+                candidates_data["brand_tone"] = None
+                yield {"type": "data", "key": "candidates", "value": candidates_data}
+
+                # Generate General Response
+                gen_response = await self.generator.generate_general_chat(user_text)
+
+                yield {"type": "data", "key": "final_message", "value": gen_response}
+                yield {"type": "data", "key": "audit_trail", "value": []}
+
+                # Fallback suggestions for general chat
+                yield {"type": "data", "key": "suggestions", "value": ["설화수 신제품 보여줘", "마케팅 문구 추천해줘", "라네즈 이벤트 알려줘"]}
+
+            yield {"type": "status", "msg": "완료되었습니다! ✨"}
+        finally:
+            # Client disconnected or a stage failed: don't leave orphaned work running
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
 
 _orch_instance = None
+_orch_lock = threading.Lock()
 def get_orchestrator():
     global _orch_instance
     if _orch_instance is None:
-        _orch_instance = Orchestrator()
+        with _orch_lock:
+            if _orch_instance is None:
+                _orch_instance = Orchestrator()
     return _orch_instance
@@ -28,12 +28,7 @@ def build_prompt(
     persona_info = loader.get_persona_info(persona_name)
     
     # Action Info by ID
-    action_info = {}
-    if action_id:
-        for ac in loader.action_cycles:
-            if ac.get("id") == action_id:
-                action_info = ac
-                break
+    action_info = loader.get_action_by_id(action_id)
     
     # 2. Format Context Sections
     
@@ -0,0 +1,184 @@
+"""
+Deterministic first stage of intent parsing.
+
+Most requests name the brand/product, scenario and sometimes the persona outright
+("설화수 자음생 크림 겨울 프로모션"), so they can be mapped without an LLM call:
+  - brand:    product_agent.normalize.BRAND_ALIASES (aliases and canonical names)
+  - action:   words of each scenario's name + matching_description, IDF-weighted so words
+              shared by every scenario ("메시지", "작성") don't count
+  - persona:  persona target_keywords, matched as whole words (optionally with a particle:
+              "민감한", "아이들"); generic audience words ("30대", "VIP 고객") mark that the
+              request names a persona even when no keyword resolves it
+The words that spell the brand are set aside first, so a brand never scores as a scenario or
+persona word ("아이오페" is not the persona keyword "아이") and always stays in the product.
+The result has the same shape as the LLM extraction plus a confidence in [0, 1];
+IntentParser only calls the LLM when the confidence is below its threshold.
+"""
+import re
+import math
+from typing import Dict, Any, List, Tuple
+from services.product_agent.normalize import BRAND_ALIASES
+
+# Confidence contribution of each recognized slot
+SLOT_WEIGHTS = {"product": 0.5, "action": 0.3, "persona": 0.2}
+
+# Request verbs / filler that are never part of a product name
+FILLER_WORDS = {
+    "문구", "메시지", "메세지", "문자", "카피", "써줘", "써주세요", "작성", "작성해줘", "만들어줘", "만들어",
+    "추천", "추천해줘", "알려줘", "해줘", "부탁해", "프로모션", "홍보", "광고", "마케팅", "캠페인", "이벤트", "용",
+    "위한", "위해", "대상",
+}
+
+# Words that describe the target audience rather than the product ("30대 VIP 고객을 위한 ...")
+AUDIENCE_TERMS = {"고객", "vip", "여성", "남성", "직장인", "엄마", "주부", "학생", "mz", "시니어", "타겟", "분들"}
+AGE_RE = re.compile(r"^\d+대")
+
+# Particles/suffixes that may follow a persona keyword inside one word ("민감한", "아이들")
+KEYWORD_SUFFIXES = {
+    "은", "는", "이", "가", "을", "를", "의", "에", "에게", "에서", "와", "과", "도", "만", "로", "으로",
+    "들", "한", "하는", "한테", "용", "성", "님", "분",
+}
+
+TOKEN_RE = re.compile(r"[0-9A-Za-z가-힣]+")
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+def _matches(query_token: str, term: str) -> bool:
+    # Korean particles/suffixes ("겨울" vs "겨울철", "보습" vs "보습을") -> prefix match either way
+    if len(query_token) < 2 or len(term) < 2:
+        return query_token == term
+    return term.startswith(query_token) or query_token.startswith(term)
+
+def _matches_keyword(token: str, keyword: str) -> bool:
+    # Whole-word match: "아이" matches "아이", "아이들", "아이들과", never "아이오페"
+    if not token.startswith(keyword):
+        return False
+    rest = token[len(keyword):]
+    if rest.startswith("들"):
+        rest = rest[1:]
+    return rest == "" or rest in KEYWORD_SUFFIXES
+
+def _is_audience(token: str) -> bool:
+    return bool(AGE_RE.match(token)) or any(_matches(token, term) for term in AUDIENCE_TERMS)
+
+class RuleIntentParser:
+    def __init__(self, personas: Dict[str, Dict[str, Any]], action_cycles: List[Dict[str, Any]]):
+        self.brand_terms = {}
+        for alias, brand in BRAND_ALIASES.items():
+            # Same normalization as the request tokens ("be ready", "labo-h")
+            self.brand_terms["".join(tokenize(alias))] = brand
+            self.brand_terms[brand] = brand
+
+        self.persona_keywords = {
+            name: [k.lower() for k in p.get("target_keywords", [])] for name, p in personas.items()
+        }
+
+        # Scenario vocabulary with IDF weights
+        self.actions = {a["id"]: a for a in action_cycles}
+        self.action_terms: Dict[str, set] = {}
+        for a in action_cycles:
+            text = " ".join([a.get("name", ""), a.get("matching_description", ""), a["id"].split("_")[-1]])
+            self.action_terms[a["id"]] = set(tokenize(text))
+        df = {}
+        for terms in self.action_terms.values():
+            for t in terms:
+                df[t] = df.get(t, 0) + 1
+        n = max(len(self.action_terms), 1)
+        self.idf = {t: math.log(n / c) for t, c in df.items()}
+
+    def _find_brand(self, tokens: List[str]) -> Tuple[str, set]:
+        """
+        (canonical brand, tokens spelling it); longest alias wins. The alias has to start a
+        token ("라보" in "콜라보" is not a brand) but may span several ("be ready").
+        """
+        starts, compact = set(), ""
+        for tok in tokens:
+            starts.add(len(compact))
+            compact += tok
+        best, span = "", (0, 0)
+        for term, brand in self.brand_terms.items():
+            pos = compact.find(term)
+            while pos != -1 and pos not in starts:
+                pos = compact.find(term, pos + 1)
+            if pos != -1 and len(term) > span[1] - span[0]:
+                best, span = brand, (pos, pos + len(term))
+        if not best:
+            return "", set()
+        brand_tokens, offset = set(), 0
+        for tok in tokens:
+            if offset < span[1] and offset + len(tok) > span[0]:
+                brand_tokens.add(tok)
+            offset += len(tok)
+        return best, brand_tokens
+
+    def _score_actions(self, tokens: List[str]) -> List[Tuple[float, str, set]]:
+        scored = []
+        for action_id, terms in self.action_terms.items():
+            score, used = 0.0, set()
+            for tok in tokens:
+                weights = [self.idf[t] for t in terms if _matches(tok, t)]
+                if weights and max(weights) > 0:
+                    score += max(weights)
+                    used.add(tok)
+            scored.append((score, action_id, used))
+        scored.sort(key=lambda x: -x[0])
+        return scored
+
+    def _score_personas(self, tokens: List[str]) -> List[Tuple[int, str]]:
+        scored = []
+        for name, keywords in self.persona_keywords.items():
+            hits = sum(1 for tok in tokens if any(_matches_keyword(tok, k) for k in keywords))
+            scored.append((hits, name))
+        scored.sort(key=lambda x: -x[0])
+        return scored
+
+    def parse(self, user_text: str) -> Tuple[Dict[str, Any], float]:
+        """
+        Returns (extracted, confidence). `extracted` uses the LLM output keys:
+        {"product", "selected_persona", "selected_action_id", "purpose"}.
+        """
+        confidence = 0.0
+
+        brand, brand_tokens = self._find_brand(tokenize(user_text))
+        if brand:
+            confidence += SLOT_WEIGHTS["product"]
+        # Scenario/persona/audience scoring never sees the brand's own words
+        tokens = [tok for tok in tokenize(user_text) if tok not in brand_tokens]
+
+        # A slot only counts when there is a clear winner
+        action_id, action_tokens = None, set()
+        actions = self._score_actions(tokens)
+        if actions and actions[0][0] > 0 and (len(actions) == 1 or actions[0][0] > actions[1][0]):
+            _, action_id, action_tokens = actions[0]
+            confidence += SLOT_WEIGHTS["action"]
+
+        persona, persona_tokens = None, set()
+        personas = self._score_personas(tokens)
+        if personas and personas[0][0] > 0 and (len(personas) == 1 or personas[0][0] > personas[1][0]):
+            persona = personas[0][1]
+            persona_tokens = {tok for tok in tokens if any(_matches_keyword(tok, k) for k in self.persona_keywords[persona])}
+            confidence += SLOT_WEIGHTS["persona"]
+
+        audience_tokens = {tok for tok in tokens if _is_audience(tok)}
+        if persona is None and (audience_tokens or (personas and personas[0][0] > 0)):
+            # The request names a persona the keywords can't resolve: the persona slot is required,
+            # so stay below the fast-path threshold and let the LLM pick it
+            confidence -= SLOT_WEIGHTS["persona"]
+
+        # Product = the request minus scenario, persona/audience words and request filler;
+        # the brand's words are always kept
+        excluded = action_tokens | persona_tokens | audience_tokens | FILLER_WORDS
+        product_words = [
+            w for w in user_text.split()
+            if set(tokenize(w)) & brand_tokens or not (set(tokenize(w)) & excluded)
+        ]
+        product = " ".join(product_words).strip() or None
+
+        extracted = {
+            "product": product,
+            "selected_persona": persona,
+            "selected_action_id": action_id,
+            "purpose": self.actions[action_id].get("name") if action_id else None,
+        }
+        return extracted, round(max(confidence, 0.0), 2)
@@ -1,9 +1,12 @@
 import json
 import math
 import re
+import pickle
+import shutil
 from typing import List, Dict, Any, Tuple
 from collections import defaultdict, Counter
 import logging
+import numpy as np
 
 from .config import WEIGHTS, RETRIEVAL_TOP_K, CANDIDATE_POOL_SIZE
 # Path moved:
@@ -12,8 +15,14 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 BACKEND_ROOT = os.path.abspath(os.path.join(BASE_DIR, "../../"))
 PRODUCT_CARDS_PATH = os.path.join(BACKEND_ROOT, "data", "product_agent", "product_cards.jsonl")
 NEWS_CARDS_PATH = os.path.join(BACKEND_ROOT, "data", "product_agent", "news_cards.jsonl")
+# Prebuilt index + tables, keyed by a hash of the source files (rebuilt when they change)
+INDEX_SNAPSHOT_DIR = os.path.join(BACKEND_ROOT, "data", "product_agent", "index_snapshot")
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_SOURCES = [PRODUCT_CARDS_PATH, NEWS_CARDS_PATH]
+from utils.fingerprint import files_sha256, files_fingerprint, is_fresh
+from utils.hot_reload import HotReloader
 from .normalize import normalize_brand, normalize_query, extract_attributes
-from .schemas import ProductCandidate, MatchDetails, Evidence, EvidenceHighlight
+from .schemas import ProductCandidate, MatchDetails, Evidence, EvidenceHighlight, Factsheet
 from .factsheet import build_factsheet
 
 # Setup Logging
@@ -21,10 +30,24 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class SimpleLexicalIndex:
-    """A simple inverted index for retrieval."""
+    """
+    BM25 index stored as a CSR term-document matrix (NumPy).
+    Row t of the matrix holds the postings of term t: doc rows in `indices`, and the
+    length-normalized, saturated term frequency tf*(k1+1)/(tf + k1*(1-b+b*dl/avgdl)) in `data`.
+    Query scoring is one sparse dot product: sum over query terms of idf[t] * row t.
+    """
+    k1 = 1.5
+    b = 0.75
+
     def __init__(self):
-        self.index = defaultdict(list)
-        self.doc_lengths = {}
+        self._staged = [] # (doc_id, Counter) until finalize()
+        self.doc_ids: List[str] = []
+        self.vocab: Dict[str, int] = {}
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.data = np.zeros(0, dtype=np.float32)
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.length_norm = np.zeros(0, dtype=np.float32)
         self.avg_doc_length = 0
         self.total_docs = 0
 
@@ -34,53 +57,168 @@ class SimpleLexicalIndex:
         return text.lower().split()
 
     def add_document(self, doc_id: str, text: str):
-        tokens = self.tokenize(text)
-        self.doc_lengths[doc_id] = len(tokens)
-        term_freqs = Counter(tokens)
-        for term, freq in term_freqs.items():
-            self.index[term].append((doc_id, freq))
+        self._staged.append((doc_id, Counter(self.tokenize(text))))
         self.total_docs += 1
 
     def finalize(self):
-        if self.total_docs > 0:
-            self.avg_doc_length = sum(self.doc_lengths.values()) / self.total_docs
+        """Build the CSR matrix, IDF and length-normalization vectors from staged documents."""
+        if not self._staged:
+            return
+        self.doc_ids = [doc_id for doc_id, _ in self._staged]
+        doc_lengths = np.array([sum(tf.values()) for _, tf in self._staged], dtype=np.float32)
+        self.avg_doc_length = float(doc_lengths.mean()) if doc_lengths.size else 0
+        avg = self.avg_doc_length or 1.0
+        self.length_norm = self.k1 * (1 - self.b + self.b * (doc_lengths / avg))
+
+        postings = defaultdict(list)
+        for row, (_, term_freqs) in enumerate(self._staged):
+            for term, freq in term_freqs.items():
+                postings[term].append((row, freq))
+
+        self.vocab = {term: i for i, term in enumerate(postings)}
+        counts = np.array([len(postings[t]) for t in self.vocab], dtype=np.int64)
+        self.indptr = np.concatenate([[0], np.cumsum(counts)])
+        self.indices = np.fromiter((row for t in self.vocab for row, _ in postings[t]), dtype=np.int32, count=int(self.indptr[-1]))
+        tf = np.fromiter((freq for t in self.vocab for _, freq in postings[t]), dtype=np.float32, count=int(self.indptr[-1]))
+        self.data = (tf * (self.k1 + 1) / (tf + self.length_norm[self.indices])).astype(np.float32)
+
+        n = len(self.doc_ids)
+        self.idf = np.log((n - counts + 0.5) / (counts + 0.5) + 1).astype(np.float32)
+        self.total_docs = n
+        self._staged = []
+
+    def score(self, query: str) -> np.ndarray:
+        """Dense BM25 score vector over all docs, normalized to 0-1 (max = 1)."""
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        term_counts = Counter(t for t in self.tokenize(query) if t in self.vocab)
+        if not term_counts:
+            return scores
+
+        rows = [self.vocab[t] for t in term_counts]
+        weights = self.idf[rows] * np.array(list(term_counts.values()), dtype=np.float32)
+        starts, ends = self.indptr[rows], self.indptr[np.array(rows) + 1]
+        # Gather the postings of all query terms at once, then scatter-add (sparse q · M)
+        lengths = ends - starts
+        offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        positions = np.arange(lengths.sum()) + offsets
+        contrib = self.data[positions] * np.repeat(weights, lengths)
+        scores = np.bincount(self.indices[positions], weights=contrib, minlength=len(self.doc_ids)).astype(np.float32)
 
-    def search(self, query: str) -> Dict[str, float]:
-        """BM25-like scoring."""
-        tokens = self.tokenize(query)
-        scores = defaultdict(float)
-        k1 = 1.5
-        b = 0.75
-        
-        for term in tokens:
-            if term not in self.index: continue
-            
-            # IDF
-            doc_freq = len(self.index[term])
-            idf = math.log((self.total_docs - doc_freq + 0.5) / (doc_freq + 0.5) + 1)
-            
-            for doc_id, freq in self.index[term]:
-                doc_len = self.doc_lengths[doc_id]
-                term_score = idf * (freq * (k1 + 1)) / (freq + k1 * (1 - b + b * (doc_len / self.avg_doc_length)))
-                scores[doc_id] += term_score
-        
         # Normalize scores to 0-1 range roughly
-        if not scores: return {}
-        max_score = max(scores.values())
+        max_score = scores.max()
         if max_score > 0:
-            for d in scores:
-                scores[d] /= max_score
+            scores /= max_score
         return scores
 
+    def search_top_k(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Top-k (doc_id, score) by BM25, best first. argpartition avoids sorting every score."""
+        scores = self.score(query)
+        hits = np.flatnonzero(scores > 0)
+        if hits.size == 0 or k <= 0:
+            return []
+        if hits.size > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.lexsort((hits, -scores[hits]))]
+        return [(self.doc_ids[i], float(scores[i])) for i in hits]
+
+    ARRAYS = ("indptr", "indices", "data", "idf", "length_norm")
+
+    def save(self, out_dir: str) -> Dict[str, Any]:
+        """Write the CSR arrays as .npy files; returns the small metadata to store alongside."""
+        for name in self.ARRAYS:
+            np.save(os.path.join(out_dir, f"index_{name}.npy"), getattr(self, name))
+        return {"doc_ids": self.doc_ids, "vocab": self.vocab, "avg_doc_length": self.avg_doc_length}
+
+    @classmethod
+    def load(cls, snap_dir: str, meta: Dict[str, Any]) -> "SimpleLexicalIndex":
+        """Memory-map a saved index (read-only, zero-copy)."""
+        index = cls()
+        for name in cls.ARRAYS:
+            setattr(index, name, np.load(os.path.join(snap_dir, f"index_{name}.npy"), mmap_mode="r"))
+        index.doc_ids = meta["doc_ids"]
+        index.vocab = meta["vocab"]
+        index.avg_doc_length = meta["avg_doc_length"]
+        index.total_docs = len(index.doc_ids)
+        return index
+
+    def search(self, query: str) -> Dict[str, float]:
+        """BM25-like scoring. Returns {doc_id: score} for every matching doc."""
+        scores = self.score(query)
+        return {self.doc_ids[i]: float(scores[i]) for i in np.flatnonzero(scores > 0)}
+
 class ProductRetriever:
-    def __init__(self):
+    def __init__(self, snapshot_dir: str = INDEX_SNAPSHOT_DIR):
         self.products = {} # id -> data
         self.news_data = {} # id -> data
         self.index = SimpleLexicalIndex()
         self.max_review_count = 1
+        self.snapshot_dir = snapshot_dir
+        self._factsheets: Dict[str, Factsheet] = {} # pid -> memoized factsheet
         self._load_data()
 
     def _load_data(self):
+        """Map the prebuilt snapshot if it matches the source files, else rebuild and save it."""
+        if self._load_snapshot():
+            return
+        self._build_from_source()
+        if self.products:
+            try:
+                self.save_snapshot()
+            except OSError as e:
+                logger.warning(f"Could not write index snapshot: {e}")
+
+    def _load_snapshot(self) -> bool:
+        manifest_path = os.path.join(self.snapshot_dir, "manifest.json")
+        if not os.path.exists(manifest_path):
+            return False
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION or not is_fresh(manifest, SNAPSHOT_SOURCES):
+                logger.info("Index snapshot is stale. Rebuilding...")
+                return False
+
+            with open(os.path.join(self.snapshot_dir, "tables.pkl"), "rb") as f:
+                tables = pickle.load(f)
+            self.products = tables["products"]
+            self.news_data = tables["news_data"]
+            self.max_review_count = tables["max_review_count"]
+            self.index = SimpleLexicalIndex.load(self.snapshot_dir, tables["index_meta"])
+        except Exception as e:
+            logger.warning(f"Failed to load index snapshot ({e}). Rebuilding...")
+            return False
+
+        logger.info(f"Loaded index snapshot {manifest['source_sha256'][:12]}: {len(self.products)} products, {len(self.news_data)} news cards.")
+        return True
+
+    def save_snapshot(self):
+        """Serialize index arrays + product/news tables. Written to a temp dir, then swapped in."""
+        tmp_dir = self.snapshot_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        tables = {
+            "products": self.products,
+            "news_data": self.news_data,
+            "max_review_count": self.max_review_count,
+            "index_meta": self.index.save(tmp_dir),
+        }
+        with open(os.path.join(tmp_dir, "tables.pkl"), "wb") as f:
+            pickle.dump(tables, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        manifest = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "source_sha256": files_sha256(SNAPSHOT_SOURCES),
+            "source_fingerprint": files_fingerprint(SNAPSHOT_SOURCES),
+        }
+        with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        shutil.rmtree(self.snapshot_dir, ignore_errors=True)
+        os.replace(tmp_dir, self.snapshot_dir)
+        logger.info(f"Saved index snapshot to {self.snapshot_dir}")
+
+    def _build_from_source(self):
         """Load product cards and build index."""
         logger.info(f"Loading products from {PRODUCT_CARDS_PATH}")
         try:
@@ -130,6 +268,14 @@ class ProductRetriever:
         except FileNotFoundError:
             logger.error(f"Data file not found: {PRODUCT_CARDS_PATH}")
 
+    def get_factsheet(self, pid: str) -> Factsheet:
+        """Factsheet for a product, built once and memoized (product data is immutable per snapshot)."""
+        factsheet = self._factsheets.get(pid)
+        if factsheet is None:
+            factsheet = build_factsheet(self.products[pid], self.news_data.get(pid))
+            self._factsheets[pid] = factsheet
+        return factsheet
+
     def parse_query(self, user_query: str) -> Dict[str, Any]:
         """Step A: Query Parsing."""
         q_norm = normalize_query(user_query)
@@ -175,15 +321,15 @@ class ProductRetriever:
         if parsed["brand"]:
             search_query += f" {parsed['brand']} " * 3 # Boost brand terms
         
-        lex_scores = self.index.search(search_query)
+        # Select Candidates (Top N)
+        sorted_cands = self.index.search_top_k(search_query, CANDIDATE_POOL_SIZE)
         
         # If no lexical matches, return empty (or fallback to popularity?)
-        if not lex_scores:
+        if not sorted_cands:
             logger.warning("No lexical matches found.")
             return []
             
-        # Select Candidates (Top N)
-        sorted_cands = sorted(lex_scores.items(), key=lambda x: x[1], reverse=True)[:CANDIDATE_POOL_SIZE]
+        lex_scores = dict(sorted_cands)
         candidate_ids = [pid for pid, score in sorted_cands]
         
         # 3. Re-ranking
@@ -237,6 +383,19 @@ class ProductRetriever:
                 WEIGHTS["log_review_count"] * log_rc_score
             )
             
+            # Only plain tuples here; models are built for the final Top-K below
+            ranked_candidates.append((round(final_score, 4), pid, matched_atts))
+            
+        # Sort by Final Score
+        ranked_candidates.sort(key=lambda x: x[0], reverse=True)
+        
+        # Apply Top-K and Reranking filter (Max 2 per base product?)
+        # For now just simple Top-K
+        final_top = []
+        for i, (score, pid, matched_atts) in enumerate(ranked_candidates[:RETRIEVAL_TOP_K]):
+            product = self.products[pid]
+            p_brand = product.get("brand", "").lower()
+            
             # 4. Build Evidence & Highlight
             highlights = []
             if parsed["brand"] == p_brand:
@@ -245,39 +404,34 @@ class ProductRetriever:
                  highlights.append(EvidenceHighlight(type="attribute_match", text=att))
             # Review snippet check? (Optional/Simple)
             
-            # 5. Build Object
-            cand = ProductCandidate(
-                rank=0, # Assigned later
+            # 5. Build Object (rank assigned by position)
+            final_top.append(ProductCandidate(
+                rank=i + 1,
                 product_id=pid,
                 brand=product.get("brand", ""),
                 product_name=product.get("product_name", ""),
-                score=round(final_score, 4),
+                score=score,
                 match=MatchDetails(
                     matched_entities=[parsed["brand"]] if parsed["brand"] else [],
                     matched_attributes=matched_atts
                 ),
-                factsheet=build_factsheet(product, self.news_data.get(pid)),
+                factsheet=self.get_factsheet(pid),
                 evidence=Evidence(highlights=highlights)
-            )
-            ranked_candidates.append(cand)
-            
-        # Sort by Final Score
-        ranked_candidates.sort(key=lambda x: x.score, reverse=True)
-        
-        # Apply Top-K and Reranking filter (Max 2 per base product?)
-        # For now just simple Top-K
-        final_top = ranked_candidates[:RETRIEVAL_TOP_K]
-        
-        # Assign Ranks
-        for i, cand in enumerate(final_top):
-            cand.rank = i + 1
+            ))
             
         return final_top
 
 # Singleton Instance (Optional, but useful for API)
-_retriever_instance = None
-def get_retriever():
-    global _retriever_instance
-    if _retriever_instance is None:
-        _retriever_instance = ProductRetriever()
-    return _retriever_instance
+# Current snapshot; rebuilt (index snapshot included) and swapped in when the cards change
+def validate_retriever(retriever: "ProductRetriever"):
+    """A missing or unreadable cards file leaves an empty index; never swap that in."""
+    if not retriever.products:
+        raise ValueError("ProductRetriever indexed no products")
+
+_retriever_reloader = HotReloader("product_index", SNAPSHOT_SOURCES, ProductRetriever, validate=validate_retriever)
+def get_retriever() -> "ProductRetriever":
+    return _retriever_reloader.get()
+
+if __name__ == "__main__":
+    # Build step: python -m services.product_agent.retriever
+    ProductRetriever()
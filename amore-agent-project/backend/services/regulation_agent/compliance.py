@@ -1,58 +1,130 @@
-from .config import SYSTEM_PROMPT_TEMPLATE, LLM_MODEL
+import json
+import asyncio
+import threading
+from utils.llm_factory import get_llm_client
+from utils.llm_cache import ResponseCache, make_cache_key
+from .config import (
+    SYSTEM_PROMPT_TEMPLATE, USER_PROMPT_TEMPLATE, PRE_VERIFIED_TEMPLATE, FLAGGED_TEMPLATE,
+    LLM_MODEL, RETRIEVAL_MODE, RETRIEVAL_PLAN_QUERIES, CONTEXT_TOKEN_BUDGET, BATCH_CONCURRENCY,
+    VERDICT_CACHE_SIZE, VERDICT_CACHE_TTL, VERDICT_CACHE_DB, VERDICT_CACHE_VERSION
+)
 from .retrieval import RetrievalEngine
 from .data_loader import get_regulation_dbs
+from .rules import RULES_VERSION, check_rules, format_feedback
 
 class ComplianceAgent:
     def __init__(self):
         print("[RegulationAgent] Initializing...")
         self.retriever = RetrievalEngine()
-        self.spam_db, self.cosmetics_db = get_regulation_dbs()
-        
-    def _run_single_check(self, crm_message, run_id):
-        """Internal function for a single pass"""
+        self.llm = get_llm_client()
+        # Current DB snapshot source (hot-reloaded); each check captures one pair and keeps it
+        self.regulation_dbs = get_regulation_dbs
+        self.regulation_dbs()
+        self.verdict_cache = ResponseCache(
+            max_entries=VERDICT_CACHE_SIZE, ttl_seconds=VERDICT_CACHE_TTL, db_path=VERDICT_CACHE_DB
+        )
+
+    @staticmethod
+    def normalize_message(crm_message: str) -> str:
+        """Collapse whitespace inside lines and drop blank lines (line structure is kept for the rules)."""
+        lines = (" ".join(line.split()) for line in crm_message.strip().splitlines())
+        return "\n".join(line for line in lines if line)
+
+    def _verdict_key(self, crm_message: str, dbs) -> str:
+        # A DB rebuild or a change to the prompts, rules, model or retrieval settings invalidates
+        # every cached verdict
+        spam_db, cosmetics_db = dbs
+        return make_cache_key(
+            "verdict", VERDICT_CACHE_VERSION, self.normalize_message(crm_message),
+            spam_db.version, cosmetics_db.version, RULES_VERSION, LLM_MODEL,
+            RETRIEVAL_MODE, RETRIEVAL_PLAN_QUERIES, CONTEXT_TOKEN_BUDGET,
+            SYSTEM_PROMPT_TEMPLATE, USER_PROMPT_TEMPLATE, PRE_VERIFIED_TEMPLATE, FLAGGED_TEMPLATE
+        )
+
+    async def _run_single_check(self, crm_message, run_id, passed_rules=None, context=None, flags=None):
+        """Internal function for a single pass (context may be pre-retrieved, e.g. by a batch)"""
         print(f"  > [RegulationAgent] Run {run_id}: Generating queries and validating...")
         
         # 1. Retrieve Context
-        context = self.retriever.get_combined_context(
-            crm_message, self.spam_db, self.cosmetics_db
-        )
+        if context is None:
+            context = (await self.retriever.get_combined_context(
+                crm_message, *self.regulation_dbs()
+            ))["text"]
         
         # 2. Construct Prompt
-        user_prompt = f"""
-        Context Regulations (Source of Truth):
-        {context}
-        
-        CRM Message (SMS/LMS):
-        {crm_message}
-        
-        Check for violations significantly strictly based on Context.
-        """
+        pre_verified = ""
+        if passed_rules:
+            pre_verified = PRE_VERIFIED_TEMPLATE.format(passed_rules=", ".join(passed_rules))
+        if flags:
+            pre_verified += FLAGGED_TEMPLATE.format(
+                flags="; ".join(f"{f['name']}: {', '.join(f['terms'])}" for f in flags)
+            )
+
+        user_prompt = USER_PROMPT_TEMPLATE.format(context=context, crm_message=crm_message, pre_verified=pre_verified)
         
-        response = self.retriever.client.chat.completions.create(
+        return await self.llm.complete(
+            user_prompt,
+            system_message=SYSTEM_PROMPT_TEMPLATE,
             model=LLM_MODEL,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT_TEMPLATE},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0
+            temperature=0,
+            max_tokens=None
         )
-        return response.choices[0].message.content
 
-    def check_compliance(self, crm_message: str) -> dict:
+    async def check_compliance(self, crm_message: str) -> dict:
         """
         Double-Check Logic.
         Returns Dict: {
             "status": "PASS" | "FAIL",
             "reason": str (Summary of failure or pass),
             "feedback": str (Detailed text including suggestion),
-            "run_1_result": str,
-            "run_2_result": str
+            "rule_report": {"passed": [...], "violations": [...], "flags": [...]},
+            "run_details": {"run_1": str, "run_2": str}
         }
         """
+        dbs = self.regulation_dbs()
+        cache_key, verdict, rule_report = await self._precheck(crm_message, dbs)
+        if verdict is not None:
+            return verdict
+        return await self._judge(crm_message, cache_key, rule_report, dbs)
+
+    async def _precheck(self, crm_message: str, dbs):
+        """
+        Verdict cache + deterministic rules (no API calls).
+        Returns (cache_key, verdict or None if the LLM still has to judge, rule_report).
+        """
+        cache_key = self._verdict_key(crm_message, dbs)
+        cached = await self.verdict_cache.aget(cache_key)
+        if cached is not None:
+            print("[RegulationAgent] Verdict cache hit")
+            return cache_key, json.loads(cached), None
+
+        # 0. Deterministic pre-check: hard violations fail without any API call
+        rule_report = check_rules(crm_message)
+        if rule_report["violations"]:
+            feedback = format_feedback(rule_report["violations"])
+            print(f"[RegulationAgent] Rule pre-check failed: {[v['id'] for v in rule_report['violations']]}")
+            print("\n[Final Verdict]: FAIL")
+            return cache_key, {
+                "status": "FAIL",
+                "feedback": feedback,
+                "rule_report": rule_report,
+                "run_details": {
+                    "run_1": feedback,
+                    "run_2": "Skipped (Rule pre-check failed)"
+                }
+            }, rule_report
+        return cache_key, None, rule_report
+
+    async def _judge(self, crm_message: str, cache_key: str, rule_report: dict, dbs, context: dict = None) -> dict:
         print("[RegulationAgent] Analyzing message with Dual-Pass Logic...")
+        if context is None:
+            context = await self.retriever.get_combined_context(crm_message, *dbs)
+        print(f"[RegulationAgent] Context: {len(context['chunk_ids'])} chunks, ~{context['tokens']} tokens ({context['dropped']} over budget)")
         
-        # Run 1
-        result1 = self._run_single_check(crm_message, 1)
+        # Run 1 (semantic review; mechanical rules already verified)
+        result1 = await self._run_single_check(
+            crm_message, 1, passed_rules=rule_report["passed"], context=context["text"], flags=rule_report["flags"]
+        )
         
         final_status = "PASS"
         detected_run = 0
@@ -78,18 +150,66 @@ class ComplianceAgent:
         
         print(f"\n[Final Verdict]: {final_status}")
         
-        return {
+        verdict = {
             "status": final_status,
             "feedback": final_feedback,
+            "rule_report": rule_report,
             "run_details": {
                 "run_1": result1,
-                "run_2": result2
+                "run_2": result2,
+                "context_tokens": context["tokens"],
+                "context_chunks": context["chunk_ids"]
             }
         }
+        await self.verdict_cache.aset(cache_key, json.dumps(verdict, ensure_ascii=False))
+        return verdict
+
+    async def check_compliance_batch(self, messages: list, concurrency: int = BATCH_CONCURRENCY) -> list:
+        """
+        Vet many messages at once. Returns one verdict (same shape as check_compliance) per
+        input message, in input order.
+        - whitespace-only duplicates are judged once
+        - contexts for every remaining message come from a single embedding request
+        - LLM judgments run concurrently, at most `concurrency` at a time
+        """
+        norms = [self.normalize_message(m) for m in messages]
+        unique = {}
+        for msg, norm in zip(messages, norms):
+            unique.setdefault(norm, msg)
+
+        dbs = self.regulation_dbs()
+        verdicts = {}
+        pending = [] # (norm, message, cache_key, rule_report)
+        for norm, msg in unique.items():
+            cache_key, verdict, rule_report = await self._precheck(msg, dbs)
+            if verdict is not None:
+                verdicts[norm] = verdict
+            else:
+                pending.append((norm, msg, cache_key, rule_report))
+
+        print(f"[RegulationAgent] Batch: {len(messages)} messages, {len(unique)} unique, {len(pending)} need LLM review")
+        if pending:
+            contexts = await self.retriever.get_combined_contexts(
+                [msg for _, msg, _, _ in pending], *dbs, concurrency=concurrency
+            )
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def judge(norm, msg, cache_key, rule_report, context):
+                async with semaphore:
+                    verdicts[norm] = await self._judge(msg, cache_key, rule_report, dbs, context=context)
+
+            await asyncio.gather(*(
+                judge(*item, context) for item, context in zip(pending, contexts)
+            ))
+
+        return [verdicts[norm] for norm in norms]
 
 _agent_instance = None
+_agent_lock = threading.Lock() # Built from worker threads (startup warm-up, first requests)
 def get_compliance_agent():
     global _agent_instance
     if _agent_instance is None:
-        _agent_instance = ComplianceAgent()
+        with _agent_lock:
+            if _agent_instance is None:
+                _agent_instance = ComplianceAgent()
     return _agent_instance
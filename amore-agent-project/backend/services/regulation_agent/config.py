@@ -16,11 +16,47 @@ load_dotenv(backend_root / ".env")
 SPAM_DB_PATH = list(data_dir.glob("*불법스팸*.json"))[0] if list(data_dir.glob("*불법스팸*.json")) else data_dir / "불법스팸_방지_안내서_임베딩.json"
 COSMETICS_DB_PATH = list(data_dir.glob("*화장품_지침*.json"))[0] if list(data_dir.glob("*화장품_지침*.json")) else data_dir / "화장품_지침_임베딩.json"
 
+# Compiled binary stores (python -m services.regulation_agent.vector_store)
+vector_store_dir = data_dir / "vector_store"
+SPAM_STORE_DIR = vector_store_dir / "spam"
+COSMETICS_STORE_DIR = vector_store_dir / "cosmetics"
+
 # OpenAI
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 # Models
 EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Regulation retrieval mode
+# "llm":  gpt-4o generates 3 search queries per message (generate_legal_queries) -- default
+# "plan": opt-in; fixed bucket queries below, their top-k chunks precomputed once (no LLM call
+#         per check, but retrieval no longer adapts to the message -> compare recall before enabling)
+RETRIEVAL_MODE = os.getenv("REGULATION_RETRIEVAL_MODE", "llm")
+RETRIEVAL_PLAN_QUERIES = [
+    "문자 메시지(SMS/LMS) 광고 표기 의무: (광고) 표시 위치, 전송자 명칭 및 연락처, 무료 수신거부 방법",  # SMS marking
+    "영리목적 광고성 정보 전송 시 공통 금지 사항: 거짓·과장 광고, 소비자 오인 표현",                      # Common ad prohibitions
+    "화장품 광고에서 의약품으로 오인하게 하는 의학적 효능 표현 금지",                                      # Cosmetics medical claims
+]
+
+# Max tokens of regulation text packed into the gpt-4o review prompt (highest-scoring chunks first)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("REGULATION_CONTEXT_TOKENS", "3000"))
+
+# Batch compliance checks: max concurrent gpt-4o calls (query generation and judgments) per batch
+BATCH_CONCURRENCY = int(os.getenv("COMPLIANCE_BATCH_CONCURRENCY", "4"))
+# Max messages accepted by one /compliance/batch request (larger requests get 413)
+BATCH_MAX_MESSAGES = int(os.getenv("COMPLIANCE_BATCH_MAX_MESSAGES", "100"))
+
+# Embedding cache (legal queries repeat heavily across messages)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))            # In-memory entries
+EMBEDDING_CACHE_DISK_SIZE = int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", "50000"))  # SQLite entries (LRU-evicted)
+EMBEDDING_CACHE_DB = os.getenv("EMBEDDING_CACHE_DB", str(backend_root / ".cache" / "embedding_cache.sqlite"))
+
+# Verdict cache (same normalized message + same regulation DBs -> same verdict)
+VERDICT_CACHE_SIZE = int(os.getenv("VERDICT_CACHE_SIZE", "1024"))
+VERDICT_CACHE_TTL = float(os.getenv("VERDICT_CACHE_TTL", str(7 * 24 * 3600)))
+VERDICT_CACHE_DB = os.getenv("VERDICT_CACHE_DB", str(backend_root / ".cache" / "verdict_cache.sqlite"))
+# Bump when a verdict input outside the cache key changes (query-generation prompt, top-k, ...)
+VERDICT_CACHE_VERSION = "1"
 LLM_MODEL = "gpt-4o"
 
 # Prompts
@@ -50,3 +86,24 @@ Case 2: 문제 없음 (PASS)
 - 판정: [통과]
 - 심사 내용: [Context]의 공통 규정(명칭, 연락처, 무료수신거부) 및 SMS 특화 규정((광고)위치) 준수 확인됨.
 """
+
+USER_PROMPT_TEMPLATE = """
+        Context Regulations (Source of Truth):
+        {context}
+        
+        CRM Message (SMS/LMS):
+        {crm_message}
+        {pre_verified}
+        Check for violations significantly strictly based on Context.
+        """
+
+PRE_VERIFIED_TEMPLATE = """
+        Pre-verified Rules (deterministic checks already PASSED, do not re-judge):
+        {passed_rules}
+        Focus on semantic issues (false/exaggerated implications, misleading claims, context-specific rules).
+        """
+
+FLAGGED_TEMPLATE = """
+        Flagged Expressions (may be violations depending on context, judge them explicitly):
+        {flags}
+        """
@@ -1,24 +1,31 @@
-import json
-import os
-from .config import SPAM_DB_PATH, COSMETICS_DB_PATH
+from .config import SPAM_DB_PATH, COSMETICS_DB_PATH, SPAM_STORE_DIR, COSMETICS_STORE_DIR
+from .vector_store import VectorDB
+from utils.hot_reload import HotReloader
 
-def load_json_db(path):
-    if not os.path.exists(path):
-        print(f"Warning: {path} not found.")
-        return []
-    with open(path, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-def get_regulation_dbs():
+def load_regulation_dbs():
     """
-    Load both Spam and Cosmetics vector databases.
+    Load both Spam and Cosmetics vector databases (memory-mapped binary stores,
+    compiled from the JSON files on first use or when the JSON changes).
     Returns:
-        tuple: (spam_db, cosmetics_db)
+        tuple: (spam_db, cosmetics_db) as VectorDB
     """
-    spam_db = load_json_db(SPAM_DB_PATH)
-    cosmetics_db = load_json_db(COSMETICS_DB_PATH)
-    
+    spam_db = VectorDB.open_or_build(str(SPAM_DB_PATH), str(SPAM_STORE_DIR), name="spam")
+    cosmetics_db = VectorDB.open_or_build(str(COSMETICS_DB_PATH), str(COSMETICS_STORE_DIR), name="cosmetics")
+
     print(f"[RegulationAgent] Loaded Spam DB: {len(spam_db)} chunks")
     print(f"[RegulationAgent] Loaded Cosmetics DB: {len(cosmetics_db)} chunks")
-    
+
     return spam_db, cosmetics_db
+
+# Current (spam_db, cosmetics_db) pair; swapped as one unit when either JSON changes
+def validate_regulation_dbs(dbs):
+    empty = [db_name for db_name, db in zip(("spam", "cosmetics"), dbs) if not len(db)]
+    if empty:
+        raise ValueError(f"Regulation DB has no chunks: {', '.join(empty)}")
+
+_dbs_reloader = HotReloader(
+    "regulation_dbs", [str(SPAM_DB_PATH), str(COSMETICS_DB_PATH)], load_regulation_dbs, validate=validate_regulation_dbs
+)
+def get_regulation_dbs():
+    """Current (spam_db, cosmetics_db) snapshot. Capture it once per request."""
+    return _dbs_reloader.get()
@@ -1,3 +1,4 @@
+import asyncio
 from services.regulation_agent.compliance import get_compliance_agent
 
 def main():
@@ -13,7 +14,7 @@ def main():
     print("--- Testing Message ---")
     print(message)
     
-    result = agent.check_compliance(message)
+    result = asyncio.run(agent.check_compliance(message))
     
     print("\n--- Result ---")
     print(f"Status: {result['status']}")
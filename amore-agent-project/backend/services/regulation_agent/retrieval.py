@@ -1,41 +1,124 @@
 import os
+import asyncio
 import numpy as np
-from openai import OpenAI
-from sklearn.metrics.pairwise import cosine_similarity
-from .config import OPENAI_API_KEY, EMBEDDING_MODEL, LLM_MODEL
+from utils.llm_factory import get_llm_client
+from utils.llm_cache import EmbeddingCache
+from .config import (
+    OPENAI_API_KEY, EMBEDDING_MODEL, LLM_MODEL, RETRIEVAL_MODE, RETRIEVAL_PLAN_QUERIES, CONTEXT_TOKEN_BUDGET,
+    EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_DISK_SIZE, EMBEDDING_CACHE_DB
+)
+from .vector_store import normalize_rows
+
+# (db name, section title) in prompt order
+CONTEXT_SECTIONS = [
+    ("spam", "Regulation 1: Spam Prevention & IT Network Act"),
+    ("cosmetics", "Regulation 2: Cosmetics Guidelines"),
+]
+
+def estimate_tokens(text: str) -> int:
+    """Tokenizer-free estimate: ~1 token per Hangul/CJK character, ~4 ASCII characters per token."""
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return non_ascii + (len(text) - non_ascii + 3) // 4
+
+def build_context(spam_docs, cosmetics_docs, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Merge the hits of both DBs, dedupe by chunk id (keeping the best score), and pack the
+    highest-scoring chunks until the token budget is used up.
+    Returns {"text", "tokens", "chunk_ids", "dropped"}.
+    """
+    best = {}
+    for section, docs in (("spam", spam_docs), ("cosmetics", cosmetics_docs)):
+        for doc in docs:
+            current = best.get(doc["id"])
+            if current is None or doc["score"] > current[1]["score"]:
+                best[doc["id"]] = (section, doc)
+
+    packed = {section: [] for section, _ in CONTEXT_SECTIONS}
+    chunk_ids, used, dropped = [], 0, 0
+    for section, doc in sorted(best.values(), key=lambda item: -item[1]["score"]):
+        block = f"Header: {doc['metadata']['header']}\nContent: {doc['metadata']['content']}\n\n"
+        cost = estimate_tokens(block)
+        if used + cost > token_budget:
+            dropped += 1 # a shorter, lower-ranked chunk may still fit
+            continue
+        packed[section].append(block)
+        chunk_ids.append(doc["id"])
+        used += cost
+
+    parts = []
+    for i, (section, title) in enumerate(CONTEXT_SECTIONS):
+        parts.append(f"{chr(10) if i else ''}-- [{title} (Total {len(packed[section])})] --\n")
+        parts.extend(packed[section])
+    text = "".join(parts)
+    return {"text": text, "tokens": estimate_tokens(text), "chunk_ids": chunk_ids, "dropped": dropped}
 
 class RetrievalEngine:
-    def __init__(self):
+    def __init__(self, embedding_cache=None):
         if not OPENAI_API_KEY:
             raise ValueError("OPENAI_API_KEY is not set.")
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
-        
-    def get_embedding(self, text, model=EMBEDDING_MODEL):
-        text = text.replace("\n", " ")
-        return self.client.embeddings.create(input=[text], model=model).data[0].embedding
+        # Shared pooled client (same connection pool / in-flight limit as the CRM agent)
+        self.client = get_llm_client()
+        self.embedding_cache = embedding_cache or EmbeddingCache(
+            max_entries=EMBEDDING_CACHE_SIZE,
+            db_path=EMBEDDING_CACHE_DB,
+            disk_max_entries=EMBEDDING_CACHE_DISK_SIZE,
+        )
+        self.mode = RETRIEVAL_MODE
+        self._plan = None # ((spam version, cosmetics version), spam hits, cosmetics hits)
+        self.token_budget = CONTEXT_TOKEN_BUDGET
 
-    def retrieve_top_k(self, query_embedding, db, k=5):
-        if not db:
-            return []
-        
-        db_embeddings = [item['embedding'] for item in db]
-        if not db_embeddings:
+    async def get_embeddings(self, texts, model=EMBEDDING_MODEL):
+        """
+        Embed several texts (order preserved). Cached vectors are reused; the misses
+        go to the API in a single request.
+        """
+        if not texts:
             return []
-            
-        similarities = cosine_similarity([query_embedding], db_embeddings)[0]
-        
-        # Get top-k indices
-        top_indices = similarities.argsort()[-k:][::-1]
-        
+        texts = [text.replace("\n", " ") for text in texts]
+        vectors = await self.embedding_cache.aget_many(model, texts)
+
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if missing:
+            fetched = dict(zip(missing, await self.client.embed(missing, model=model)))
+            await self.embedding_cache.aset_many(model, fetched)
+            vectors = [v if v is not None else np.asarray(fetched[t], dtype=np.float32)
+                       for t, v in zip(texts, vectors)]
+        return vectors
+
+    async def get_embedding(self, text, model=EMBEDDING_MODEL):
+        embeddings = await self.get_embeddings([text], model=model)
+        return embeddings[0]
+
+    def search(self, query_embeddings, db, k=5):
+        """
+        Score every query against the DB in one matmul (rows are pre-normalized -> cosine).
+        Returns one top-k result list per query.
+        """
+        if not len(db):
+            return [[] for _ in query_embeddings]
+
+        queries = normalize_rows(np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1))
+        similarities = queries @ db.matrix.T # (n_queries, n_chunks)
+
+        k = min(k, len(db))
+        # Top-k per row without a full sort, then order just those k
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+
         results = []
-        for idx in top_indices:
-            results.append({
-                "score": similarities[idx],
-                "metadata": db[idx]['metadata']
-            })
+        for row, indices in enumerate(top):
+            results.append([
+                {"id": f"{db.name}:{idx}", "score": float(similarities[row, idx]), "metadata": db.metadata[idx]}
+                for idx in indices
+            ])
         return results
 
-    def generate_legal_queries(self, crm_message):
+    def retrieve_top_k(self, query_embedding, db, k=5):
+        return self.search([query_embedding], db, k=k)[0]
+
+    async def generate_legal_queries(self, crm_message):
         """
         Smart Query Generation using LLM.
         """
@@ -54,54 +137,67 @@ class RetrievalEngine:
         Output List only.
         """
         
-        response = self.client.chat.completions.create(
-            model=LLM_MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0
+        content = await self.client.complete(
+            prompt, model=LLM_MODEL, temperature=0, max_tokens=None
         )
         
-        queries = response.choices[0].message.content.strip().split("\n")
+        queries = content.strip().split("\n")
         return [q.split(". ")[-1] for q in queries if q.strip()]
 
-    def get_combined_context(self, message, spam_db, cosmetics_db):
-        # 1. Query Expansion
-        search_queries = self.generate_legal_queries(message)
-        print(f"[RegulationAgent] Generated Search Queries: {search_queries}")
-        
-        all_spam_docs = []
-        all_cosmetics_docs = []
-        
-        # 2. Retrieve for EACH query
-        for q in search_queries:
-            q_vec = self.get_embedding(q)
-            all_spam_docs.extend(self.retrieve_top_k(q_vec, spam_db, k=3))
-            all_cosmetics_docs.extend(self.retrieve_top_k(q_vec, cosmetics_db, k=3))
-            
-        # Also retrieve for original message
-        original_vec = self.get_embedding(message)
-        all_spam_docs.extend(self.retrieve_top_k(original_vec, spam_db, k=3))
-        all_cosmetics_docs.extend(self.retrieve_top_k(original_vec, cosmetics_db, k=3))
-        
-        # 3. Deduplicate
-        def deduplicate(docs):
-            unique_docs = []
-            seen_headers = set()
-            for doc in docs:
-                key = doc['metadata']['header'] + doc['metadata']['content'][:30]
-                if key not in seen_headers:
-                    unique_docs.append(doc)
-                    seen_headers.add(key)
-            return unique_docs
-
-        final_spam_docs = deduplicate(all_spam_docs)
-        final_cosmetics_docs = deduplicate(all_cosmetics_docs)
-        
-        context_text = f"-- [Regulation 1: Spam Prevention & IT Network Act (Total {len(final_spam_docs)})] --\n"
-        for doc in final_spam_docs:
-            context_text += f"Header: {doc['metadata']['header']}\nContent: {doc['metadata']['content']}\n\n"
-            
-        context_text += f"\n-- [Regulation 2: Cosmetics Guidelines (Total {len(final_cosmetics_docs)})] --\n"
-        for doc in final_cosmetics_docs:
-            context_text += f"Header: {doc['metadata']['header']}\nContent: {doc['metadata']['content']}\n\n"
-            
-        return context_text
+    async def prepare_plan(self, spam_db, cosmetics_db):
+        """
+        Precompute the top-k chunks of the fixed plan queries (once per DB version).
+        Returns (spam hits, cosmetics hits), flattened in query order.
+        """
+        versions = (spam_db.version, cosmetics_db.version)
+        if self._plan is None or self._plan[0] != versions:
+            plan_vecs = await self.get_embeddings(RETRIEVAL_PLAN_QUERIES)
+            spam_hits = [hit for hits in self.search(plan_vecs, spam_db, k=3) for hit in hits]
+            cosmetics_hits = [hit for hits in self.search(plan_vecs, cosmetics_db, k=3) for hit in hits]
+            self._plan = (versions, spam_hits, cosmetics_hits)
+            print(f"[RegulationAgent] Retrieval plan ready ({len(RETRIEVAL_PLAN_QUERIES)} queries)")
+        return self._plan[1], self._plan[2]
+
+    async def get_combined_context(self, message, spam_db, cosmetics_db):
+        return (await self.get_combined_contexts([message], spam_db, cosmetics_db))[0]
+
+    async def get_combined_contexts(self, messages, spam_db, cosmetics_db, concurrency=None):
+        """
+        Regulation context for each message ({"text", "tokens", "chunk_ids", "dropped"});
+        every query of every message goes out in one embedding request.
+        `concurrency` bounds the concurrent query-generation LLM calls (llm mode).
+        """
+        if self.mode == "plan":
+            # 1. Precomputed plan: only the messages themselves are embedded per request
+            plan_spam, plan_cosmetics = await self.prepare_plan(spam_db, cosmetics_db)
+            queries_per_message = [[] for _ in messages]
+        else:
+            # 1. Query Expansion (one LLM call per message, concurrently, at most `concurrency` at a time)
+            plan_spam, plan_cosmetics = [], []
+            semaphore = asyncio.Semaphore(concurrency or max(len(messages), 1))
+
+            async def expand(message):
+                async with semaphore:
+                    return await self.generate_legal_queries(message)
+            queries_per_message = await asyncio.gather(*(expand(m) for m in messages))
+            for queries in queries_per_message:
+                print(f"[RegulationAgent] Generated Search Queries: {queries}")
+
+        # 2. Retrieve for EACH query (+ the original message): one embedding request, scored at once
+        texts, owners = [], []
+        for i, (message, queries) in enumerate(zip(messages, queries_per_message)):
+            texts.extend(queries + [message])
+            owners.extend([i] * (len(queries) + 1))
+        query_vecs = await self.get_embeddings(texts)
+
+        all_spam_docs = [list(plan_spam) for _ in messages]
+        all_cosmetics_docs = [list(plan_cosmetics) for _ in messages]
+        for owner, hits in zip(owners, self.search(query_vecs, spam_db, k=3)):
+            all_spam_docs[owner].extend(hits)
+        for owner, hits in zip(owners, self.search(query_vecs, cosmetics_db, k=3)):
+            all_cosmetics_docs[owner].extend(hits)
+
+        return [
+            build_context(spam_docs, cosmetics_docs, self.token_budget)
+            for spam_docs, cosmetics_docs in zip(all_spam_docs, all_cosmetics_docs)
+        ]
@@ -0,0 +1,148 @@
+"""
+Deterministic compliance pre-check.
+
+The [MANDATORY RULES] given to the generator (crm_agent/prompt_engine.py) are mechanically
+checkable, so they are verified here with compiled regexes before any LLM/embedding call:
+  1. "(광고)" on the first line
+  2. a 무료수신거부 line
+  3. the sender's name and a contact number (not the opt-out number)
+  4. no medical/therapeutic claims
+  5. no exaggerated claims
+Hard violations fail the message immediately; the rules that passed are handed to the
+LLM pass so it only has to judge semantic issues. Terms that are only suspicious out of
+context ("개선된 제형", "최고급") are flagged for the LLM instead of failing the message.
+"""
+import re
+from typing import List, Dict, Any, Optional
+
+# Part of the verdict cache key: bump on any change to the terms or checks below
+RULES_VERSION = "2"
+
+# Hard terms are claims in any context; soft terms are sent to the LLM with the message
+MEDICAL_TERMS = ["치료", "처방", "부작용 없음", "주름 개선", "피부 개선", "개선 효과", "피부 회복", "회복 효과"]
+MEDICAL_SOFT_TERMS = ["개선", "회복"]
+EXAGGERATION_TERMS = ["국내 최고", "업계 최고", "세계 최고", "최고의 효과", "완벽한 효과", "100% 효과", "즉시 효과"]
+# ...or as a word of their own ("최고!", "완벽 커버"), not inside "최고급"/"완벽한"
+EXAGGERATION_WORDS = ["최고", "완벽"]
+EXAGGERATION_SOFT_TERMS = ["최고", "완벽", "100%", "즉시"]
+# Words that label a contact line without naming the sender
+CONTACT_LABELS = ["문의", "연락처", "전화", "대표번호", "tel", "수신거부", "무료"]
+
+def _term_pattern(terms: List[str], words: List[str] = ()) -> re.Pattern:
+    # One alternation scan per term list; spaces inside a term match any whitespace.
+    # `words` only match when no Hangul follows (Korean has no \b between word and suffix)
+    alternatives = [r"\s*".join(map(re.escape, t.split())) for t in terms]
+    alternatives += [re.escape(w) + r"(?![가-힣])" for w in words]
+    return re.compile("|".join(alternatives))
+
+AD_LABEL_RE = re.compile(r"^\s*\(광고\)")
+OPT_OUT_RE = re.compile(r"무료\s*수신\s*거부|수신\s*거부\s*[:：]?\s*무료")
+PHONE_RE = re.compile(r"(?<!\d)(?:0\d{1,2}[-.\s]?\d{3,4}[-.\s]?\d{4}|1[5-9]\d{2}[-.\s]?\d{4})(?!\d)")
+CONTACT_LABEL_RE = re.compile("|".join(map(re.escape, CONTACT_LABELS)), re.IGNORECASE)
+MEDICAL_RE = _term_pattern(MEDICAL_TERMS)
+MEDICAL_SOFT_RE = _term_pattern(MEDICAL_SOFT_TERMS)
+EXAGGERATION_RE = _term_pattern(EXAGGERATION_TERMS, EXAGGERATION_WORDS)
+EXAGGERATION_SOFT_RE = _term_pattern(EXAGGERATION_SOFT_TERMS)
+
+def _first_line(message: str) -> str:
+    lines = [line for line in message.strip().splitlines() if line.strip()]
+    return lines[0].strip() if lines else ""
+
+def _lines_with(pattern: re.Pattern, message: str) -> List[str]:
+    return [line.strip() for line in message.splitlines() if pattern.search(line)]
+
+def _check_ad_label(message: str) -> Optional[Dict[str, Any]]:
+    first = _first_line(message)
+    if AD_LABEL_RE.match(first):
+        return None
+    return {
+        "description": "메시지 첫 줄이 '(광고)'로 시작하지 않습니다. (광고 표기 누락)",
+        "fixes": [(first, f"(광고) {first}")],
+    }
+
+def _check_opt_out(message: str) -> Optional[Dict[str, Any]]:
+    if OPT_OUT_RE.search(message):
+        return None
+    return {
+        "description": "무료수신거부 문구가 없습니다.",
+        "fixes": [("(없음)", "[수신거부: 무료 080-XXX-XXXX]")],
+    }
+
+def _names_sender(line: str) -> bool:
+    # Whatever is left after the number and generic labels has to name the sender
+    rest = CONTACT_LABEL_RE.sub("", PHONE_RE.sub("", line))
+    return re.search(r"[가-힣A-Za-z]{2,}", rest) is not None
+
+def _check_contact(message: str) -> Optional[Dict[str, Any]]:
+    # The 080 opt-out line does not count as the sender's contact
+    contact_lines = [line for line in _lines_with(PHONE_RE, message) if not OPT_OUT_RE.search(line)]
+    if any(_names_sender(line) for line in contact_lines):
+        return None
+    return {
+        "description": "전송자 연락처(전화번호)가 없습니다.",
+        "fixes": [("(없음)", "전송자 명칭과 연락처 추가 (예: 아모레퍼시픽 고객센터 080-XXX-XXXX)")],
+    }
+
+def _found_terms(pattern: re.Pattern, message: str) -> List[str]:
+    return list(dict.fromkeys(m.group(0) for m in pattern.finditer(message)))
+
+def _banned_terms_check(pattern: re.Pattern, label: str):
+    def check(message: str) -> Optional[Dict[str, Any]]:
+        found = _found_terms(pattern, message)
+        if not found:
+            return None
+        return {
+            "description": f"{label} 사용: {', '.join(found)}",
+            "fixes": [(line, pattern.sub("", line).strip() + " (해당 표현 삭제/완화)") for line in _lines_with(pattern, message)],
+        }
+    return check
+
+# (id, name, regulation, check) -- check returns None when the rule passes
+RULES = [
+    ("ad_label", "(광고) 표기 위치", "정보통신망법 제50조 제4항 (광고 표기)", _check_ad_label),
+    ("opt_out", "무료수신거부 표기", "정보통신망법 제50조 제4항 (무료 수신거부 방법)", _check_opt_out),
+    ("contact", "전송자 연락처 표기", "정보통신망법 제50조 제4항 (전송자 명칭 및 연락처)", _check_contact),
+    ("medical_claims", "의학적 효능 표현 금지", "화장품법 제13조 (의약품 오인 표현 금지)", _banned_terms_check(MEDICAL_RE, "의학적/치료적 효능 표현")),
+    ("exaggeration", "과장 표현 금지", "화장품 표시·광고 관리 지침 (과장 광고 금지)", _banned_terms_check(EXAGGERATION_RE, "과장 표현")),
+]
+
+# rule id -> soft terms; a hit takes the rule off the pre-verified list so the LLM judges it
+SOFT_TERMS = {
+    "medical_claims": MEDICAL_SOFT_RE,
+    "exaggeration": EXAGGERATION_SOFT_RE,
+}
+
+def check_rules(message: str) -> Dict[str, Any]:
+    """
+    Run every deterministic rule.
+    Returns {"passed": [rule names],
+             "violations": [{"id", "name", "regulation", "description", "fixes"}],
+             "flags": [{"id", "name", "regulation", "terms"}]}  # left to the LLM
+    """
+    passed, violations, flags = [], [], []
+    for rule_id, name, regulation, check in RULES:
+        result = check(message)
+        if result is not None:
+            violations.append({"id": rule_id, "name": name, "regulation": regulation, **result})
+            continue
+        terms = _found_terms(SOFT_TERMS[rule_id], message) if rule_id in SOFT_TERMS else []
+        if terms:
+            flags.append({"id": rule_id, "name": name, "regulation": regulation, "terms": terms})
+        else:
+            passed.append(name)
+    return {"passed": passed, "violations": violations, "flags": flags}
+
+def format_feedback(violations: List[Dict[str, Any]]) -> str:
+    """Render violations in the same '- 판정: [실패]' layout the LLM reviewer uses."""
+    lines = [
+        "- 판정: [실패]",
+        f"- 근거 규정: {', '.join(v['regulation'] for v in violations)}",
+        "- 위반 설명: " + " / ".join(v["description"] for v in violations),
+        "- 수정 제안 (Before -> After):",
+    ]
+    n = 1
+    for v in violations:
+        for before, after in v["fixes"]:
+            lines.append(f"  {n}. [{before}] -> [{after}]")
+            n += 1
+    return "\n".join(lines)
@@ -0,0 +1,121 @@
+"""
+Binary embedding store for the regulation vector DBs.
+
+`compile_vector_store` converts one `*_임베딩.json` file (pretty-printed, one float per line)
+into a directory:
+  manifest.json     format version, source fingerprint, chunk count, dimension
+  embeddings.npy    (n_chunks x dim) float32, rows already L2-normalized
+  metadata.json     compact list of chunk metadata ({"header", "content"}), row-aligned
+
+`VectorDB.open_or_build` maps embeddings.npy with np.load(mmap_mode="r"), so a chunk costs
+dim * 4 bytes (6KB for text-embedding-3-small) instead of a list of boxed Python floats.
+
+Usage:
+    python -m services.regulation_agent.vector_store   # (re)build both DBs
+"""
+import os
+import json
+import shutil
+import numpy as np
+from typing import List, Dict, Any
+from utils.fingerprint import files_sha256, files_fingerprint, is_fresh
+
+FORMAT_VERSION = 1
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize each row (zero rows stay zero) into a C-contiguous float32 array."""
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    if matrix.size == 0:
+        return matrix
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def compile_vector_store(json_path: str, out_dir: str) -> Dict[str, Any]:
+    """Compile a JSON embedding DB into the binary layout. Written to a temp dir, then swapped in."""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        records = json.load(f)
+
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    if records:
+        matrix = normalize_rows(np.asarray([item['embedding'] for item in records], dtype=np.float32))
+    else:
+        matrix = np.zeros((0, 0), dtype=np.float32)
+    np.save(os.path.join(tmp_dir, "embeddings.npy"), matrix)
+
+    with open(os.path.join(tmp_dir, "metadata.json"), "w", encoding="utf-8") as f:
+        json.dump([item['metadata'] for item in records], f, ensure_ascii=False, separators=(",", ":"))
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "source_sha256": files_sha256([json_path]),
+        "source_fingerprint": files_fingerprint([json_path]),
+        "n_chunks": int(matrix.shape[0]),
+        "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+    }
+    with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return manifest
+
+def _is_fresh(json_path: str, out_dir: str) -> bool:
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return False
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    return manifest.get("format_version") == FORMAT_VERSION and is_fresh(manifest, [json_path])
+
+class VectorDB:
+    """
+    Regulation chunks as one contiguous, L2-normalized float32 matrix (n_chunks x dim)
+    plus row-aligned metadata. Cosine similarity against it is a single matrix multiply.
+    """
+    def __init__(self, matrix: np.ndarray, metadata: List[Dict[str, Any]], version: str = "", name: str = ""):
+        self.matrix = matrix
+        self.metadata = metadata
+        self.version = version # source content hash; changes whenever the DB is rebuilt
+        self.name = name       # chunk ids are "<name>:<row>", e.g. "spam:12"
+
+    def __len__(self):
+        return len(self.metadata)
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]], name: str = "") -> "VectorDB":
+        """In-memory DB from [{"metadata": ..., "embedding": [...]}, ...] records."""
+        if records:
+            matrix = normalize_rows(np.asarray([item['embedding'] for item in records], dtype=np.float32))
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        return cls(matrix, [item['metadata'] for item in records], name=name)
+
+    @classmethod
+    def load(cls, store_dir: str, name: str = "") -> "VectorDB":
+        with open(os.path.join(store_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        with open(os.path.join(store_dir, "metadata.json"), "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+        matrix = np.load(os.path.join(store_dir, "embeddings.npy"), mmap_mode="r")
+        return cls(matrix, metadata, version=manifest["source_sha256"], name=name)
+
+    @classmethod
+    def open_or_build(cls, json_path: str, store_dir: str, name: str = "") -> "VectorDB":
+        """Open the compiled store, (re)compiling first if missing or stale vs. the JSON source."""
+        if not os.path.exists(json_path) and not os.path.exists(store_dir):
+            print(f"Warning: {json_path} not found.")
+            return cls.from_records([], name=name)
+        if os.path.exists(json_path) and not _is_fresh(json_path, store_dir):
+            print(f"[RegulationAgent] Compiling vector store -> {store_dir}")
+            compile_vector_store(json_path, store_dir)
+        return cls.load(store_dir, name=name)
+
+if __name__ == "__main__":
+    from .config import SPAM_DB_PATH, COSMETICS_DB_PATH, SPAM_STORE_DIR, COSMETICS_STORE_DIR
+    for json_path, store_dir in [(SPAM_DB_PATH, SPAM_STORE_DIR), (COSMETICS_DB_PATH, COSMETICS_STORE_DIR)]:
+        manifest = compile_vector_store(str(json_path), str(store_dir))
+        print(f"Compiled {manifest['n_chunks']} chunks (dim {manifest['dim']}) -> {store_dir}")
@@ -1,3 +1,4 @@
+import asyncio
 import pytest
 from services.crm_agent.intent_parser import get_intent_parser
 from services.regulation_agent.compliance import get_compliance_agent
@@ -6,30 +7,289 @@ def test_intent_parser_structure():
     """Verify Intent Parser returns correct structure."""
     parser = get_intent_parser()
     query = "설화수 자음생 크림 프로모션 문구 써줘"
-    result = parser.parse_query(query)
+    result = asyncio.run(parser.parse_query(query))
     
     assert "target_product" in result
     assert "target_persona" in result
     assert "selected_id" in result
     assert "candidates" in result
 
-def test_compliance_check_pass():
+def isolate_compliance_agent(agent, monkeypatch):
+    """Keep the checks offline: canned regulation context, empty in-memory verdict cache."""
+    from unittest.mock import AsyncMock
+    from utils.llm_cache import ResponseCache
+    context = {"text": "[spam] 정보통신망법 제50조 제4항", "tokens": 20, "chunk_ids": ["spam-1"], "dropped": 0}
+    retrieve = AsyncMock(return_value=context)
+    monkeypatch.setattr(agent.retriever, "get_combined_context", retrieve)
+    monkeypatch.setattr(agent, "verdict_cache", ResponseCache(max_entries=8))
+    return retrieve
+
+def test_compliance_check_pass(monkeypatch):
     """Verify compliance agent passes safe message."""
     agent = get_compliance_agent()
-    safe_msg = "(광고) 아모레퍼시픽\n이 제품은 설화수의 베스트셀러입니다.\n무료수신거부 080-1234-5678"
+    retrieve = isolate_compliance_agent(agent, monkeypatch)
+    safe_msg = "(광고) 아모레퍼시픽\n이 제품은 설화수의 베스트셀러입니다.\n아모레퍼시픽 고객센터 1588-1234\n무료수신거부 080-1234-5678"
     
     # Mock the LLM call to return a success indicating response
     from unittest.mock import patch
     with patch.object(agent, '_run_single_check', return_value="[통과] 안전한 메시지입니다."):
-        result = agent.check_compliance(safe_msg)
+        result = asyncio.run(agent.check_compliance(safe_msg))
     
     assert result["status"] == "PASS"
+    retrieve.assert_awaited_once()
 
-def test_compliance_check_fail():
+def test_compliance_check_fail(monkeypatch):
     """Verify compliance agent fails on unsafe keywords (missing ad tag)."""
     agent = get_compliance_agent()
+    retrieve = isolate_compliance_agent(agent, monkeypatch)
     unsafe_msg = "이 제품은 설화수의 베스트셀러입니다." # Missing (광고)
-    result = agent.check_compliance(unsafe_msg)
+    result = asyncio.run(agent.check_compliance(unsafe_msg))
     
     assert result["status"] == "FAIL"
     assert "광고 표기 누락" in result["feedback"] or "광고" in result["feedback"]
+    retrieve.assert_not_awaited() # Rule pre-check fails before any retrieval
+
+def test_segment_index_matches_target_codes():
+    """Verify the precomputed segment index agrees with a direct scan of Target_Code."""
+    import ast
+    import pandas as pd
+    from services.crm_agent.data_loader import get_data_loader, CUSTOMER_DATA_PATH
+    loader = get_data_loader()
+    df = pd.read_csv(CUSTOMER_DATA_PATH)
+    df.columns = df.columns.str.strip()
+
+    expected = [
+        str(row["customer_id"]).strip()
+        for _, row in df.iterrows()
+        if any(code.split("_")[-1] == "WINBACK" for code in ast.literal_eval(row["Target_Code"]))
+    ]
+    assert loader.filter_customers_by_target("winback") == expected
+    assert loader.count_customers_by_target("WINBACK") == len(expected)
+    assert loader.filter_customers_by_target("UNKNOWN") == []
+
+    both = loader.intersect_segments("WINBACK", "WINTER")
+    assert set(both) <= set(expected)
+    assert set(both) <= set(loader.filter_customers_by_target("WINTER"))
+
+def test_customer_store_roundtrip(tmp_path):
+    """Verify the compiled columnar store reproduces the CSV columns."""
+    import numpy as np
+    import pandas as pd
+    from services.crm_agent.customer_store import CustomerStore
+    from services.crm_agent.data_loader import CUSTOMER_DATA_PATH
+
+    store = CustomerStore.open_or_build(CUSTOMER_DATA_PATH, str(tmp_path / "store"))
+    df = pd.read_csv(CUSTOMER_DATA_PATH)
+    df.columns = df.columns.str.strip()
+
+    assert store.n_customers == len(df)
+    assert store.customer_ids() == df["customer_id"].astype(str).str.strip().tolist()
+    assert isinstance(store.column("Recency_days"), np.memmap)
+    assert np.array_equal(store.column("Recency_days"), df["Recency_days"].to_numpy())
+
+def test_intent_fast_path_skips_llm():
+    """Verify explicit brand + scenario requests are parsed by rules, vague ones fall back to the LLM."""
+    from unittest.mock import patch
+    parser = get_intent_parser()
+
+    with patch.object(parser.llm, "generate", side_effect=AssertionError("LLM must not be called")):
+        result = asyncio.run(parser.parse_query("설화수 자음생 크림 겨울 프로모션"))
+    assert result["extracted"]["parse_mode"] == "rules"
+    assert result["target_product"] == "설화수 자음생 크림"
+    assert result["selected_id"] == "G05_WINTER"
+
+    with patch.object(parser.llm, "generate", return_value='{"product": "크림", "selected_persona": null, "selected_action_id": "G01_WELCOME", "purpose": "신규"}') as llm:
+        result = asyncio.run(parser.parse_query("요즘 잘 나가는 거 뭐야?"))
+    assert llm.called
+    assert result["extracted"]["parse_mode"] == "llm"
+    assert result["selected_id"] == "G01_WELCOME"
+
+def test_intent_rules_keep_persona_out_of_product():
+    """Verify a request naming brand, persona and scenario keeps the persona and a clean product query."""
+    from unittest.mock import patch
+    parser = get_intent_parser()
+
+    with patch.object(parser.llm, "generate", side_effect=AssertionError("LLM must not be called")):
+        result = asyncio.run(parser.parse_query("민감 고객을 위한 설화수 자음생 크림 신규 메시지"))
+    assert result["extracted"]["parse_mode"] == "rules"
+    assert result["target_product"] == "설화수 자음생 크림"
+    assert result["target_persona"] == "성분깐깐 민감케어러"
+    assert result["selected_id"] == "G01_WELCOME"
+
+    # Audience the keywords can't resolve: brand + scenario alone must not skip the LLM
+    extracted, confidence = parser.rule_parse("30대 VIP 고객을 위한 설화수 자음생 크림 재구매 문구")
+    assert extracted["product"] == "설화수 자음생 크림"
+    assert not parser.is_fast_path(confidence)
+
+def test_intent_rules_keep_brand_words_out_of_persona_matching():
+    """Verify a brand containing a persona keyword ("아이오페" / "아이") stays the product, not a persona."""
+    parser = get_intent_parser()
+
+    extracted, confidence = parser.rule_parse("아이오페 레티놀 봄 시즌 캠페인")
+    assert extracted["product"] == "아이오페 레티놀"
+    assert extracted["selected_persona"] is None
+    assert extracted["selected_action_id"] == "G05_SPRING"
+    assert confidence < 1.0
+
+    # The keyword itself (with particles) still resolves the persona
+    extracted, _ = parser.rule_parse("아이들과 함께 쓰는 일리윤 대용량 로션")
+    assert extracted["selected_persona"] == "실용파 패밀리·헬스케어 매니저"
+    assert "일리윤" in extracted["product"]
+
+def test_intent_context_is_cached_until_reload():
+    """Verify the parser's prompt prefix is built once and rebuilt for a new DataLoader snapshot."""
+    from services.crm_agent.data_loader import DataLoader
+    parser = get_intent_parser()
+    first = parser._context()
+    assert parser._context() is first
+    assert first["system_message"].index("[Persona List]") > first["system_message"].index("Task:")
+
+    rebuilt = parser._context(DataLoader())
+    assert rebuilt is not first
+    assert rebuilt["system_message"] == first["system_message"]
+
+def test_ngram_index_ranks_by_similarity():
+    """Verify the n-gram index returns ranked (key, score) pairs and honours the cutoff."""
+    from utils.fuzzy_index import NgramIndex, char_ngrams
+    assert char_ngrams("자음생 크림") == {"자음", "음생", "생크", "크림"}
+
+    index = NgramIndex([("a", "성분깐깐 민감케어러"), ("b", "트렌드 메이크업 헌터"), ("c", "민감 피부")])
+    results = index.search("민감케어", k=3)
+    assert [key for key, _ in results] == ["a", "c"]
+    assert results[0][1] > results[1][1]
+    assert index.search("민감케어", cutoff=0.9) == []
+    assert index.search("") == []
+
+def test_intent_candidates_carry_scores():
+    """Verify fuzzy persona fallback yields real scores aligned with the candidate names."""
+    from unittest.mock import patch
+    parser = get_intent_parser()
+    llm_json = '{"product": "크림", "selected_persona": "없는 페르소나", "selected_action_id": null, "purpose": "재구매"}'
+    with patch.object(parser.llm, "generate", return_value=llm_json):
+        result = asyncio.run(parser.parse_query("성분깐깐 민감 고객"))
+
+    scores = result["candidate_scores"]
+    assert len(scores["persona"]) == len(result["candidates"]["persona"])
+    assert result["candidates"]["persona"][0] == "성분깐깐 민감케어러"
+    assert 0.4 <= scores["persona"][0] <= 1.0
+    assert len(scores["purpose"]) == len(result["candidates"]["purpose"])
+
+def test_loader_lookups_match_linear_scan():
+    """Verify the hashed resolvers return what the original first-match scans returned."""
+    from services.crm_agent.data_loader import get_data_loader
+    loader = get_data_loader()
+
+    def scan(table, name):
+        if name in table:
+            return table[name]
+        return next((v for k, v in table.items() if name in k or k in name), {})
+
+    for brand in list(loader.brand_voices)[:5]:
+        for query in (brand, brand[:2], f"{brand} 크림"):
+            assert loader.get_brand_voice(query) == scan(loader.brand_voices, query)
+    for persona in list(loader.personas)[:5]:
+        for query in (persona, persona[:3], f"{persona} 고객"):
+            assert loader.get_persona_info(query) == scan(loader.personas, query)
+    if "설화수" in loader.brand_voices:
+        assert loader.get_brand_voice("sulwhasoo") == loader.brand_voices["설화수"]
+
+    for action in loader.action_cycles:
+        assert loader.get_action_by_id(action["id"]) is action
+        assert loader.get_action_info(f"[{action['id']}]: x") is action
+        q = action.get("name", "").lower()
+        expected = next(a for a in loader.action_cycles
+                        if q in a.get("stage_name", "").lower() or q in a.get("message_goal", "").lower()
+                        or q in a.get("name", "").lower() or q == a.get("id", "").lower())
+        assert loader.get_action_info(action.get("name", "")) is expected
+    assert loader.get_action_info("없는 목적")["strategy"]
+
+def test_name_resolver_containing_matches_substring_scan():
+    """Verify the gram-indexed containment lookup returns the first entry a substring scan finds."""
+    from services.crm_agent.lookup import NameResolver
+    texts = ["설화수 자음생 크림", "설화수 윤조에센스", "라네즈 워터뱅크 크림", "헤라 블랙 쿠션", "크림", "수"]
+    resolver = NameResolver((t, i) for i, t in enumerate(texts))
+
+    for query in ["크림", "설화수", "윤조", "수", "쿠션", "라네즈 워터", "자음생 크림", "없음", "림 ", ""]:
+        expected = next((i for i, t in enumerate(texts) if query and query in t), None)
+        assert resolver.containing(query) == expected, query
+    # Postings grow with the total name length, not with the number of substrings
+    assert sum(len(p) for p in resolver.grams.values()) <= 2 * sum(len(t) for t in texts)
+
+def test_stream_skips_unneeded_speculative_work():
+    """Verify a rule-parsed product skips raw-text speculation and general chat never builds an audience."""
+    from types import SimpleNamespace
+    from unittest.mock import patch
+    from services.crm_agent import orchestrator as orch_mod
+
+    retrieved, audiences = [], []
+    class FakeParser:
+        def rule_parse(self, text, loader):
+            return {"product": "설화수 크림"}, 1.0
+        def is_fast_path(self, confidence):
+            return confidence >= 0.8
+        async def parse_query(self, text, loader=None, rule_result=None):
+            return {"extracted": dict(rule_result[0]), "candidates": {"persona": [], "purpose": []}}
+
+    async def general_chat(text):
+        return "안녕하세요"
+
+    orch = orch_mod.Orchestrator.__new__(orch_mod.Orchestrator)
+    orch.parser = FakeParser()
+    orch.generator = SimpleNamespace(generate_general_chat=general_chat)
+    orch._retrieve_with_voice = lambda query, retriever, loader: (retrieved.append(query), ([], {}))[1]
+    orch._build_target_audience = lambda purpose, loader: audiences.append(purpose)
+
+    async def collect():
+        return [event async for event in orch.process_query_stream("설화수 크림 문구 써줘")]
+    with patch.object(orch_mod, "get_retriever", return_value=None), patch.object(orch_mod, "get_data_loader", return_value=None):
+        events = asyncio.run(collect())
+
+    assert retrieved == ["설화수 크림"]
+    assert audiences == []
+    assert {"type": "data", "key": "final_message", "value": "안녕하세요"} in events
+
+def test_stream_emits_draft_deltas_before_the_checked_message():
+    """Verify generation deltas are streamed as 'delta' events and the final message is their concatenation."""
+    from types import SimpleNamespace
+    from unittest.mock import patch
+    from services.crm_agent import orchestrator as orch_mod
+    from services.regulation_agent import compliance
+
+    class FakeParser:
+        def rule_parse(self, text, loader):
+            return {"product": "설화수 자음생 크림"}, 1.0
+        def is_fast_path(self, confidence):
+            return True
+        async def parse_query(self, text, loader=None, rule_result=None):
+            return {"extracted": dict(rule_result[0]), "candidates": {"persona": ["성분깐깐 민감케어러"], "purpose": []}}
+
+    class FakeGenerator:
+        async def generate_response_stream(self, **kwargs):
+            for delta in ["(광고) ", "설화수 ", "자음생 크림"]:
+                yield delta
+        async def generate_suggestions(self, **kwargs):
+            return ["더 짧게 줄여줘"]
+
+    async def check_compliance(message):
+        return {"status": "PASS", "feedback": ""}
+
+    product = SimpleNamespace(product_name="자음생 크림", brand="설화수", score=1.0,
+                              factsheet=SimpleNamespace(voice_info=SimpleNamespace(key_claims=[])))
+    orch = orch_mod.Orchestrator.__new__(orch_mod.Orchestrator)
+    orch.parser = FakeParser()
+    orch.generator = FakeGenerator()
+    orch._retrieve_with_voice = lambda query, retriever, loader: ([product], {"brand_name": "설화수"})
+    orch._build_target_audience = lambda purpose, loader: None
+
+    async def collect():
+        return [event async for event in orch.process_query_stream("설화수 자음생 크림 문구")]
+    with patch.object(orch_mod, "get_retriever", return_value=None), \
+         patch.object(orch_mod, "get_data_loader", return_value=None), \
+         patch.object(compliance, "get_compliance_agent", return_value=SimpleNamespace(check_compliance=check_compliance)):
+        events = asyncio.run(collect())
+
+    deltas = [e["value"] for e in events if e["type"] == "delta"]
+    assert deltas == ["(광고) ", "설화수 ", "자음생 크림"]
+    final = next(e for e in events if e.get("key") == "final_message")
+    assert final["value"] == "".join(deltas)
+    assert events.index(final) > max(i for i, e in enumerate(events) if e["type"] == "delta")
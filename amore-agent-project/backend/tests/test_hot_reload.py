@@ -0,0 +1,99 @@
+import os
+import json
+import threading
+import time
+from utils.hot_reload import HotReloader
+
+def test_hot_reloader_swaps_only_on_content_change(tmp_path):
+    """Verify a rebuilt snapshot is swapped in atomically and held references stay on the old one."""
+    source = tmp_path / "cards.jsonl"
+    source.write_text("v1")
+    builds = []
+    def build():
+        builds.append(source.read_text())
+        return {"data": builds[-1]}
+
+    reloader = HotReloader("test", [str(source)], build)
+    in_flight = reloader.get()
+    assert reloader.get() is in_flight and reloader.check() is False
+
+    st = os.stat(source)
+    os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9)) # touched, same content
+    assert reloader.check() is False and len(builds) == 1
+
+    source.write_text("v2 changed")
+    assert reloader.check() is True
+    assert reloader.get() == {"data": "v2 changed"} and reloader.version == 2
+    assert in_flight == {"data": "v1"}
+
+class SlowSnapshot:
+    """Fills its fields one by one (with pauses), like an index build would."""
+    def __init__(self, text: str):
+        self.version = text
+        time.sleep(0.005)
+        self.rows = [text] * 50
+        time.sleep(0.005)
+        self.index = {text: list(range(50))}
+
+    def consistent(self) -> bool:
+        return set(self.rows) == {self.version} and list(self.index) == [self.version]
+
+def test_request_keeps_a_consistent_snapshot_across_swaps(tmp_path):
+    """Verify readers only ever see complete snapshots and a held snapshot never changes under them."""
+    source = tmp_path / "cards.jsonl"
+    source.write_text("v0")
+    reloader = HotReloader("test", [str(source)], lambda: SlowSnapshot(source.read_text()))
+
+    request_snapshot = reloader.get() # Captured once at request start
+    seen, errors, done = set(), [], threading.Event()
+
+    def reader():
+        while not done.is_set():
+            snapshot = reloader.get()
+            seen.add(snapshot.version)
+            if not snapshot.consistent():
+                errors.append(snapshot.version)
+
+    readers = [threading.Thread(target=reader) for _ in range(4)]
+    for t in readers:
+        t.start()
+    for i in range(1, 6):
+        source.write_text(f"v{i}")
+        assert reloader.check() is True
+        # The in-flight request still reads its own, unchanged snapshot
+        assert request_snapshot.version == "v0" and request_snapshot.consistent()
+    done.set()
+    for t in readers:
+        t.join()
+
+    assert errors == []
+    assert reloader.get().version == "v5" and len(seen) > 1
+
+def test_corrupt_source_keeps_the_old_snapshot(tmp_path, monkeypatch):
+    """Verify a truncated source that loads as an empty DataLoader is rejected and the old one kept."""
+    import shutil
+    import pytest
+    from services.crm_agent import data_loader as dl_mod
+
+    original = dl_mod.ACTION_CYCLE_PATH
+    actions = tmp_path / "action_cycle_db.json"
+    shutil.copy(original, actions)
+    monkeypatch.setattr(dl_mod, "ACTION_CYCLE_PATH", str(actions))
+    reloader = HotReloader("crm_data_test", [str(actions)], dl_mod.DataLoader, validate=dl_mod.validate_loader)
+    good = reloader.get()
+    assert good.action_cycles
+
+    actions.write_text(actions.read_text(encoding="utf-8")[:200], encoding="utf-8") # Truncated mid-write
+    with pytest.raises(ValueError, match="action_cycles"):
+        reloader.check()
+    assert reloader.get() is good and reloader.version == 1
+    assert reloader.check() is False # Same broken file is not rebuilt on every tick
+
+    shutil.copy(original, actions) # Restored: same content as the served snapshot, nothing to swap
+    assert reloader.check() is False and reloader.get() is good
+
+    data = json.loads(actions.read_text(encoding="utf-8"))
+    data["marketing_scenarios"] = data["marketing_scenarios"][:1]
+    actions.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    assert reloader.check() is True
+    assert len(reloader.get().action_cycles) == 1 and reloader.version == 2
@@ -1,10 +1,14 @@
 import os
+import asyncio
 import pytest
 from services.crm_agent.orchestrator import get_orchestrator
 from services.product_agent.config import PRODUCT_CARDS_PATH
 
 REPORT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "execution_trace_report.md"))
 
+async def _collect_events(orch, query):
+    return [event async for event in orch.process_query_stream(query)]
+
 def test_trace_execution_flow():
     """
     Runs an end-to-end query and generates a trace report.
@@ -27,7 +31,7 @@ def test_trace_execution_flow():
     print(f"\n[Trace] Processing Query: {query}")
     
     # Stream processing
-    for event in orch.process_query_stream(query):
+    for event in asyncio.run(_collect_events(orch, query)):
         evt_type = event.get("type")
         key = event.get("key")
         val = event.get("value")
@@ -0,0 +1,214 @@
+import asyncio
+import time
+import pytest
+from types import SimpleNamespace
+from utils.llm_cache import LRUCache, SQLiteCache, ResponseCache, make_cache_key
+from utils.llm_factory import LLMClient
+
+class FakeCompletions:
+    """Stands in for openai's chat.completions; counts network round trips."""
+    def __init__(self):
+        self.calls = 0
+
+    async def create(self, **params):
+        self.calls += 1
+        content = f"reply #{self.calls}"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+@pytest.fixture(autouse=True)
+def no_api_key(monkeypatch):
+    # backend/.env may provide a real key; these tests only talk to the injected fake client
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+
+def make_client(**kwargs):
+    client = LLMClient(api_key=None, cache=ResponseCache(max_entries=8), **kwargs)
+    completions = FakeCompletions()
+    client.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return client, completions
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a") # 'a' becomes most recent
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+def test_sqlite_tier_ttl_and_promotion(tmp_path):
+    db_path = str(tmp_path / "llm_cache.sqlite")
+    cache = ResponseCache(max_entries=4, ttl_seconds=60, db_path=db_path)
+    cache.set("k", "value")
+
+    # A fresh process only has the disk tier
+    reopened = ResponseCache(max_entries=4, ttl_seconds=60, db_path=db_path)
+    assert reopened.get("k") == "value"
+    assert reopened.stats()["disk_hits"] == 1
+    assert reopened.memory.get("k") == "value"
+
+    expired = SQLiteCache(str(tmp_path / "expired.sqlite"), ttl_seconds=0.01)
+    expired.set("k", "value")
+    time.sleep(0.05)
+    assert expired.get("k") is None
+
+def test_injected_client_is_kept_when_a_key_is_set():
+    """Verify a new event loop doesn't replace an injected client with a real SDK client."""
+    client, completions = make_client()
+    client.api_key = "sk-test"
+
+    asyncio.run(client.generate("same prompt", temperature=0))
+    asyncio.run(client.generate("other prompt", temperature=0))
+    assert completions.calls == 2
+
+def test_async_access_reads_disk_tier_off_the_loop(tmp_path, monkeypatch):
+    """Verify aget/aset hand SQLite work to a worker thread and still promote disk hits."""
+    import threading
+    db_path = str(tmp_path / "llm_cache.sqlite")
+    asyncio.run(ResponseCache(max_entries=4, db_path=db_path).aset("k", "value"))
+
+    cache = ResponseCache(max_entries=4, db_path=db_path)
+    loop_thread = threading.get_ident()
+    disk_threads = []
+    disk_get = cache.disk.get
+    def tracking_get(key):
+        disk_threads.append(threading.get_ident())
+        return disk_get(key)
+    monkeypatch.setattr(cache.disk, "get", tracking_get)
+
+    assert asyncio.run(cache.aget("k")) == "value"
+    assert asyncio.run(cache.aget("k")) == "value" # memory hit, no disk read
+    assert len(disk_threads) == 1 and disk_threads[0] != loop_thread
+    assert cache.stats()["disk_hits"] == 1
+
+def test_cache_key_is_content_addressed():
+    assert make_cache_key("m", None, "p", 0) == make_cache_key("m", None, "p", 0)
+    assert make_cache_key("m", None, "p", 0) != make_cache_key("m", None, "p", 0.7)
+
+def test_temperature_zero_calls_are_cached_by_default():
+    client, completions = make_client()
+
+    first = asyncio.run(client.generate("same prompt", temperature=0))
+    second = asyncio.run(client.generate("same prompt", temperature=0))
+
+    assert first == second
+    assert completions.calls == 1
+    assert client.cache_stats()["hits"] == 1
+
+def test_cache_key_includes_max_tokens():
+    """Verify calls with different output limits don't share a cached reply."""
+    client, completions = make_client()
+
+    asyncio.run(client.generate("same prompt", temperature=0, max_tokens=50))
+    asyncio.run(client.generate("same prompt", temperature=0, max_tokens=600))
+    asyncio.run(client.generate("same prompt", temperature=0, max_tokens=600))
+    assert completions.calls == 2
+
+def test_sampled_calls_skip_cache_unless_requested():
+    client, completions = make_client()
+
+    asyncio.run(client.generate("creative prompt"))
+    asyncio.run(client.generate("creative prompt"))
+    assert completions.calls == 2
+
+    asyncio.run(client.generate("creative prompt", cache=True))
+    asyncio.run(client.generate("creative prompt", cache=True))
+    assert completions.calls == 3
+
+def test_usage_tracks_cached_prompt_tokens():
+    client, completions = make_client()
+    usage = SimpleNamespace(prompt_tokens=1200, completion_tokens=30,
+                            prompt_tokens_details=SimpleNamespace(cached_tokens=1024))
+
+    async def create(**params):
+        completions.calls += 1
+        return SimpleNamespace(usage=usage, choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))])
+    completions.create = create
+
+    asyncio.run(client.generate("a", system_message="static prefix"))
+    asyncio.run(client.generate("b", system_message="static prefix"))
+
+    stats = client.usage_stats()
+    assert stats["calls"] == 2
+    assert stats["cached_tokens"] == 2048
+    assert stats["cached_ratio"] == round(2048 / 2400, 4)
+
+def test_client_works_across_event_loops():
+    """Verify the in-flight semaphore is bound per loop, so the singleton survives a new loop."""
+    client, completions = make_client(max_in_flight=1)
+
+    async def slow_create(**params):
+        completions.calls += 1
+        await asyncio.sleep(0.01)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))])
+    completions.create = slow_create
+
+    async def burst():
+        # Contended semaphore -> it binds to this loop
+        return await asyncio.gather(*(client.generate(f"p{i}") for i in range(3)))
+
+    assert asyncio.run(burst()) == ["ok"] * 3
+    assert asyncio.run(burst()) == ["ok"] * 3
+    assert completions.calls == 6
+
+class FakeStream:
+    """Stands in for openai's AsyncStream: async-iterable chunks, closed via async with."""
+    def __init__(self, deltas, fail_after=None):
+        self.deltas = deltas
+        self.fail_after = fail_after
+        self.closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.closed = True
+
+    async def __aiter__(self):
+        for i, delta in enumerate(self.deltas):
+            if self.fail_after is not None and i == self.fail_after:
+                raise RuntimeError("connection reset")
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+
+def make_streaming_client(stream):
+    client, completions = make_client()
+    async def create(**params):
+        assert params["stream"] is True
+        completions.calls += 1
+        return stream
+    completions.create = create
+    return client
+
+def test_stream_yields_deltas_and_closes_the_stream():
+    stream = FakeStream(["(광고) ", "", "설화수", " 자음생"])
+    client = make_streaming_client(stream)
+
+    async def collect():
+        return [delta async for delta in client.stream("prompt")]
+    assert asyncio.run(collect()) == ["(광고) ", "설화수", " 자음생"]
+    assert stream.closed
+
+def test_stream_is_closed_when_the_consumer_stops_early():
+    """A disconnected SSE client closes the generator; the pooled connection must be released."""
+    stream = FakeStream(["a", "b", "c"])
+    client = make_streaming_client(stream)
+
+    async def first_then_close():
+        gen = client.stream("prompt")
+        first = await gen.__anext__()
+        await gen.aclose()
+        return first
+    assert asyncio.run(first_then_close()) == "a"
+    assert stream.closed
+
+def test_generate_stream_reports_api_failures_as_text():
+    stream = FakeStream(["a", "b"], fail_after=1)
+    client = make_streaming_client(stream)
+
+    async def collect():
+        return [delta async for delta in client.generate_stream("prompt")]
+    deltas = asyncio.run(collect())
+    assert deltas[0] == "a"
+    assert "connection reset" in deltas[-1]
+    assert stream.closed
@@ -0,0 +1,51 @@
+import asyncio
+import main
+
+def test_warm_up_retries_and_gates_only_on_local_data(monkeypatch):
+    """Verify a failed data load is retried with backoff and agent failures don't block readiness."""
+    monkeypatch.setattr(main, "readiness", {"ready": False, "error": None, "attempts": 0, "components": {}, "deferred": {}})
+    monkeypatch.setattr(main, "WARMUP_RETRY_BASE_DELAY", 0.01)
+    monkeypatch.setattr(main, "start_watchers", lambda: None)
+
+    calls = []
+    def flaky_retriever():
+        calls.append(1)
+        if len(calls) < 3:
+            raise OSError("index snapshot busy")
+        return object()
+    def no_api_key():
+        raise ValueError("OPENAI_API_KEY is not set.")
+    monkeypatch.setattr(main, "get_retriever", flaky_retriever)
+    monkeypatch.setattr(main, "get_data_loader", lambda: object())
+    monkeypatch.setattr(main, "get_regulation_dbs", lambda: (object(), object()))
+    monkeypatch.setattr(main, "get_orchestrator", lambda: object())
+    monkeypatch.setattr(main, "get_compliance_agent", no_api_key)
+
+    assert main.ready_check().status_code == 503
+    asyncio.run(main.warm_up())
+
+    assert main.readiness["attempts"] == 3
+    assert main.readiness["ready"] and main.readiness["error"] is None
+    assert "compliance_agent" in main.readiness["deferred"]
+    assert main.ready_check().status_code == 200
+
+def test_compliance_batch_endpoint(monkeypatch):
+    """Verify /compliance/batch returns one verdict per message and rejects empty/oversize batches."""
+    from fastapi.testclient import TestClient
+
+    batches = []
+    class FakeAgent:
+        async def check_compliance_batch(self, messages):
+            batches.append(list(messages))
+            return [{"status": "FAIL" if "최고" in m else "PASS", "feedback": m} for m in messages]
+    monkeypatch.setattr(main, "get_compliance_agent", lambda: FakeAgent())
+    monkeypatch.setattr(main, "BATCH_MAX_MESSAGES", 3)
+    client = TestClient(main.app) # No `with`: the warm-up lifespan is not needed here
+
+    response = client.post("/compliance/batch", json={"messages": ["(광고) 안녕하세요", "(광고) 최고의 크림"]})
+    assert response.status_code == 200
+    assert [r["status"] for r in response.json()["results"]] == ["PASS", "FAIL"]
+
+    assert client.post("/compliance/batch", json={"messages": []}).status_code == 400
+    assert client.post("/compliance/batch", json={"messages": ["m"] * 4}).status_code == 413
+    assert batches == [["(광고) 안녕하세요", "(광고) 최고의 크림"]]
@@ -0,0 +1,87 @@
+import math
+from services.product_agent.retriever import SimpleLexicalIndex
+
+DOCS = {
+    "p1": "설화수 자음생 크림 보습 탄력",
+    "p2": "라네즈 워터뱅크 크림 수분 보습",
+    "p3": "설화수 윤조 에센스",
+    "p4": "헤라 선크림 자외선",
+}
+
+def build_index():
+    index = SimpleLexicalIndex()
+    for doc_id, text in DOCS.items():
+        index.add_document(doc_id, text)
+    index.finalize()
+    return index
+
+def reference_bm25(query):
+    """Straightforward per-posting BM25 (the original loop implementation)."""
+    k1, b = 1.5, 0.75
+    docs = {d: SimpleLexicalIndex().tokenize(t) for d, t in DOCS.items()}
+    avg = sum(len(t) for t in docs.values()) / len(docs)
+    scores = {}
+    for term in SimpleLexicalIndex().tokenize(query):
+        df = sum(term in toks for toks in docs.values())
+        if not df:
+            continue
+        idf = math.log((len(docs) - df + 0.5) / (df + 0.5) + 1)
+        for d, toks in docs.items():
+            tf = toks.count(term)
+            if tf:
+                scores[d] = scores.get(d, 0.0) + idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(toks) / avg))
+    top = max(scores.values())
+    return {d: s / top for d, s in scores.items()}
+
+def test_vectorized_bm25_matches_reference():
+    index = build_index()
+    for query in ["설화수 크림", "보습 보습 수분", "선크림", "없는단어"]:
+        expected = reference_bm25(query) if query != "없는단어" else {}
+        got = index.search(query)
+        assert got.keys() == expected.keys()
+        for doc_id, score in expected.items():
+            assert math.isclose(got[doc_id], score, rel_tol=1e-5)
+
+def test_search_top_k_is_sorted_and_truncated():
+    index = build_index()
+    top = index.search_top_k("설화수 크림 보습", 2)
+    full = sorted(index.search("설화수 크림 보습").items(), key=lambda x: -x[1])
+
+    assert len(top) == 2
+    assert [score for _, score in top] == sorted([score for _, score in top], reverse=True)
+    assert math.isclose(top[0][1], full[0][1])
+
+def test_index_snapshot_roundtrip(tmp_path):
+    """A retriever opened from the saved snapshot ranks exactly like a freshly built one."""
+    import numpy as np
+    from services.product_agent.retriever import ProductRetriever
+
+    snapshot_dir = str(tmp_path / "index_snapshot")
+    built = ProductRetriever(snapshot_dir=snapshot_dir)
+    loaded = ProductRetriever(snapshot_dir=snapshot_dir)
+
+    assert isinstance(loaded.index.data, np.memmap)
+    assert loaded.products.keys() == built.products.keys()
+    query = "라네즈 워터뱅크 크림"
+    assert [c.product_id for c in loaded.retrieve(query)] == [c.product_id for c in built.retrieve(query)]
+
+def test_factsheets_are_built_for_returned_candidates_only_and_memoized(tmp_path, monkeypatch):
+    """Repeated retrieve() calls reuse the memoized factsheet; nothing is built for non-returned products."""
+    from services.product_agent import retriever as retriever_mod
+
+    retriever = retriever_mod.ProductRetriever(snapshot_dir=str(tmp_path / "index_snapshot"))
+    built = []
+    real_build = retriever_mod.build_factsheet
+    def counting_build(product, news):
+        built.append(product)
+        return real_build(product, news)
+    monkeypatch.setattr(retriever_mod, "build_factsheet", counting_build)
+
+    query = "라네즈 워터뱅크 크림"
+    first = retriever.retrieve(query)
+    assert first and len(built) == len(first)
+    assert set(retriever._factsheets) == {c.product_id for c in first}
+
+    second = retriever.retrieve(query)
+    assert len(built) == len(first) # nothing rebuilt
+    assert all(a.factsheet is b.factsheet for a, b in zip(first, second))
@@ -0,0 +1,298 @@
+import numpy as np
+from services.regulation_agent.vector_store import VectorDB, compile_vector_store
+from services.regulation_agent.retrieval import RetrievalEngine
+
+def make_db(n=20, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    records = [
+        {"metadata": {"header": f"조항 {i}", "content": f"내용 {i}"}, "embedding": rng.normal(size=dim).tolist()}
+        for i in range(n)
+    ]
+    return records, VectorDB.from_records(records)
+
+def make_engine():
+    # Skip the API-key check in __init__; memory-only embedding cache
+    from utils.llm_cache import EmbeddingCache
+    engine = RetrievalEngine.__new__(RetrievalEngine)
+    engine.embedding_cache = EmbeddingCache(max_entries=64)
+    engine.mode = "llm"
+    engine._plan = None
+    engine.token_budget = 3000
+    return engine
+
+def test_batched_search_matches_per_query_cosine():
+    records, db = make_db()
+    queries = np.random.default_rng(1).normal(size=(4, 16))
+    emb = np.asarray([r["embedding"] for r in records])
+
+    results = make_engine().search(queries.tolist(), db, k=3)
+
+    assert len(results) == 4
+    for q, hits in zip(queries, results):
+        cos = emb @ q / (np.linalg.norm(emb, axis=1) * np.linalg.norm(q))
+        expected = np.argsort(-cos)[:3]
+        assert [h["metadata"]["header"] for h in hits] == [f"조항 {i}" for i in expected]
+        assert np.allclose([h["score"] for h in hits], cos[expected], atol=1e-5)
+
+def test_search_handles_empty_db_and_small_k():
+    engine = make_engine()
+    assert engine.search([[0.1, 0.2]], VectorDB.from_records([]), k=3) == [[]]
+
+    _, db = make_db(n=2)
+    hits = engine.retrieve_top_k(np.ones(16), db, k=5)
+    assert len(hits) == 2
+    assert hits[0]["score"] >= hits[1]["score"]
+
+def test_compiled_store_roundtrip(tmp_path):
+    """The mmap store holds the same normalized matrix/metadata as the JSON records."""
+    import json
+    records, in_memory = make_db()
+    json_path = tmp_path / "db.json"
+    json_path.write_text(json.dumps(records, ensure_ascii=False), encoding="utf-8")
+    store_dir = str(tmp_path / "store")
+
+    manifest = compile_vector_store(str(json_path), store_dir)
+    db = VectorDB.open_or_build(str(json_path), store_dir)
+
+    assert manifest["n_chunks"] == len(db) == 20
+    assert isinstance(db.matrix, np.memmap)
+    assert db.matrix.dtype == np.float32
+    assert np.allclose(db.matrix, in_memory.matrix)
+    assert db.metadata == in_memory.metadata
+    assert db.version == manifest["source_sha256"]
+
+def test_combined_context_embeds_all_queries_in_one_request():
+    import asyncio
+    from types import SimpleNamespace
+    _, db = make_db()
+    calls = []
+
+    async def embed(texts, model=None):
+        calls.append(list(texts))
+        return np.random.default_rng(len(calls)).normal(size=(len(texts), 16)).tolist()
+
+    async def complete(prompt, **kwargs):
+        return "1. 수신거부 표기 요건\n2. 과장 광고 금지\n3. 화장품 의학적 효능 표현"
+
+    engine = make_engine()
+    engine.client = SimpleNamespace(embed=embed, complete=complete)
+    context = asyncio.run(engine.get_combined_context("(광고) 신제품\n안내", db, db))
+
+    assert calls == [["수신거부 표기 요건", "과장 광고 금지", "화장품 의학적 효능 표현", "(광고) 신제품 안내"]]
+    assert "Regulation 1" in context["text"] and "Regulation 2" in context["text"]
+
+def test_query_generation_fan_out_is_bounded():
+    import asyncio
+    from types import SimpleNamespace
+    _, db = make_db()
+    active, peak = [0], [0]
+
+    async def embed(texts, model=None):
+        return np.random.default_rng(0).normal(size=(len(texts), 16)).tolist()
+
+    async def complete(prompt, **kwargs):
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        await asyncio.sleep(0.01)
+        active[0] -= 1
+        return "1. 수신거부 표기 요건"
+
+    engine = make_engine()
+    engine.client = SimpleNamespace(embed=embed, complete=complete)
+    messages = [f"(광고) 메시지 {i}" for i in range(6)]
+    contexts = asyncio.run(engine.get_combined_contexts(messages, db, db, concurrency=2))
+
+    assert len(contexts) == 6
+    assert peak[0] == 2
+
+def test_embedding_cache_skips_repeated_queries(tmp_path):
+    import asyncio
+    from types import SimpleNamespace
+    from utils.llm_cache import EmbeddingCache
+    calls = []
+
+    async def embed(texts, model=None):
+        calls.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+    engine = make_engine()
+    engine.client = SimpleNamespace(embed=embed)
+    engine.embedding_cache = EmbeddingCache(max_entries=8, db_path=str(tmp_path / "emb.sqlite"))
+
+    asyncio.run(engine.get_embeddings(["수신거부 표기 요건", "과장 광고"]))
+    vectors = asyncio.run(engine.get_embeddings(["수신거부  표기 요건", "새 질의", "새 질의"]))
+
+    assert calls == [["수신거부 표기 요건", "과장 광고"], ["새 질의"]]
+    assert np.allclose(vectors[0], [len("수신거부 표기 요건"), 1.0])
+    assert np.allclose(vectors[1], vectors[2])
+    assert engine.embedding_cache.stats()["hits"] == 1
+
+    # Survives a restart through the SQLite tier
+    reopened = EmbeddingCache(max_entries=8, db_path=str(tmp_path / "emb.sqlite"))
+    assert reopened.get_many("text-embedding-3-small", ["과장 광고"])[0] is not None
+
+def test_rule_precheck_passes_compliant_message():
+    from services.regulation_agent.rules import check_rules
+    msg = "(광고) 설화수\n자음생 크림으로 촉촉한 하루를 시작하세요.\n고객센터 1588-1234\n[수신거부: 무료 080-1234-5678]"
+    report = check_rules(msg)
+    assert report["violations"] == []
+    assert len(report["passed"]) == 5
+
+def test_rule_precheck_reports_hard_violations():
+    from services.regulation_agent.rules import check_rules, format_feedback
+    msg = "설화수 자음생 크림\n주름 개선에 최고! 부작용 없음"
+    report = check_rules(msg)
+
+    ids = [v["id"] for v in report["violations"]]
+    assert ids == ["ad_label", "opt_out", "contact", "medical_claims", "exaggeration"]
+    feedback = format_feedback(report["violations"])
+    assert feedback.startswith("- 판정: [실패]")
+    assert "광고 표기 누락" in feedback
+    assert "개선" in feedback and "부작용 없음" in feedback and "최고" in feedback
+
+def test_rule_precheck_needs_sender_contact_beside_opt_out():
+    from services.regulation_agent.rules import check_rules
+    opt_out_only = "(광고) 설화수\n자음생 크림 출시\n[수신거부: 무료 080-1234-5678]"
+    unnamed = "(광고) 설화수\n자음생 크림 출시\n문의: 1588-1234\n[수신거부: 무료 080-1234-5678]"
+    named = "(광고) 설화수\n자음생 크림 출시\n설화수 080-023-5454\n[수신거부: 무료 080-1234-5678]"
+
+    assert [v["id"] for v in check_rules(opt_out_only)["violations"]] == ["contact"]
+    assert [v["id"] for v in check_rules(unnamed)["violations"]] == ["contact"]
+    assert check_rules(named)["violations"] == []
+
+def test_rule_precheck_flags_context_dependent_terms_for_the_llm():
+    from services.regulation_agent.rules import check_rules
+    msg = "(광고) 설화수\n최고급 원료로 개선된 제형을 만나보세요.\n고객센터 1588-1234\n[수신거부: 무료 080-1234-5678]"
+    report = check_rules(msg)
+
+    assert report["violations"] == []
+    assert [(f["id"], f["terms"]) for f in report["flags"]] == [("medical_claims", ["개선"]), ("exaggeration", ["최고"])]
+    # Flagged rules are not reported to the LLM as pre-verified
+    assert "의학적 효능 표현 금지" not in report["passed"] and "과장 표현 금지" not in report["passed"]
+
+def make_agent(tmp_path, verdict_fn):
+    """ComplianceAgent without API access: the LLM pass is replaced by verdict_fn(message)."""
+    from types import SimpleNamespace
+    from utils.llm_cache import ResponseCache
+    from services.regulation_agent.compliance import ComplianceAgent
+
+    runs = []
+    async def fake_check(crm_message, run_id, passed_rules=None, context=None, flags=None):
+        runs.append(crm_message)
+        return verdict_fn(crm_message)
+
+    _, db = make_db()
+    db.version = "v1"
+    agent = ComplianceAgent.__new__(ComplianceAgent)
+    agent.regulation_dbs = lambda: (db, db)
+    agent.verdict_cache = ResponseCache(max_entries=8, db_path=str(tmp_path / "verdicts.sqlite"))
+    agent._run_single_check = fake_check
+
+    async def embed(texts, model=None):
+        return np.random.default_rng(0).normal(size=(len(texts), 16)).tolist()
+    agent.retriever = make_engine()
+    agent.retriever.client = SimpleNamespace(embed=embed)
+    agent.retriever.mode = "plan"
+    agent.retriever._plan = (("v1", "v1"), [], [])
+    return agent, db, runs
+
+def test_verdict_cache_reuses_llm_verdict_for_whitespace_variants(tmp_path):
+    import asyncio
+    agent, db, runs = make_agent(tmp_path, lambda msg: "- 판정: [통과]")
+
+    msg = "(광고) 설화수\n촉촉한 하루\n고객센터 1588-1234\n무료수신거부 080-1234-5678"
+    first = asyncio.run(agent.check_compliance(msg))
+    second = asyncio.run(agent.check_compliance("  (광고)  설화수\n\n촉촉한   하루\n고객센터 1588-1234\n무료수신거부 080-1234-5678 "))
+    assert first == second
+    assert first["status"] == "PASS"
+    assert len(runs) == 1
+
+    # A rebuilt regulation DB invalidates cached verdicts
+    db.version = "v2"
+    asyncio.run(agent.check_compliance(msg))
+    assert len(runs) == 2
+
+def test_verdict_key_covers_prompts_rules_and_context_budget(tmp_path, monkeypatch):
+    from services.regulation_agent import compliance
+    agent, db, _ = make_agent(tmp_path, lambda msg: "- 판정: [통과]")
+    dbs = (db, db)
+    msg = "(광고) 설화수\n고객센터 1588-1234\n무료수신거부 080-1234-5678"
+
+    keys = {agent._verdict_key(msg, dbs)}
+    for name, value in [
+        ("USER_PROMPT_TEMPLATE", compliance.USER_PROMPT_TEMPLATE + "\nRespond in Korean."),
+        ("PRE_VERIFIED_TEMPLATE", ""),
+        ("RULES_VERSION", compliance.RULES_VERSION + "-next"),
+        ("CONTEXT_TOKEN_BUDGET", compliance.CONTEXT_TOKEN_BUDGET // 2),
+        ("VERDICT_CACHE_VERSION", compliance.VERDICT_CACHE_VERSION + "-next"),
+    ]:
+        with monkeypatch.context() as m:
+            m.setattr(compliance, name, value)
+            keys.add(agent._verdict_key(msg, dbs))
+    assert len(keys) == 6
+
+def test_plan_mode_embeds_only_the_message_per_check():
+    import asyncio
+    from types import SimpleNamespace
+    from services.regulation_agent.config import RETRIEVAL_PLAN_QUERIES
+    _, db = make_db()
+    calls = []
+
+    async def embed(texts, model=None):
+        calls.append(list(texts))
+        return np.random.default_rng(len(calls)).normal(size=(len(texts), 16)).tolist()
+
+    async def complete(prompt, **kwargs):
+        raise AssertionError("plan mode must not call the LLM")
+
+    engine = make_engine()
+    engine.mode = "plan"
+    engine.client = SimpleNamespace(embed=embed, complete=complete)
+
+    asyncio.run(engine.prepare_plan(db, db))
+    asyncio.run(engine.get_combined_context("(광고) 첫 메시지", db, db))
+    context = asyncio.run(engine.get_combined_context("(광고) 두번째 메시지", db, db))
+
+    assert calls == [list(RETRIEVAL_PLAN_QUERIES), ["(광고) 첫 메시지"], ["(광고) 두번째 메시지"]]
+    assert "Regulation 1" in context["text"]
+
+def test_batch_dedupes_and_returns_verdicts_in_input_order(tmp_path):
+    import asyncio
+    from types import SimpleNamespace
+    agent, _, runs = make_agent(tmp_path, lambda msg: "- 판정: [실패]" if "미백" in msg else "- 판정: [통과]")
+    embed_calls = []
+
+    async def embed(texts, model=None):
+        embed_calls.append(list(texts))
+        return np.random.default_rng(0).normal(size=(len(texts), 16)).tolist()
+    agent.retriever.client = SimpleNamespace(embed=embed)
+
+    ok = "(광고) 설화수\n촉촉한 하루\n고객센터 1588-1234\n무료수신거부 080-1234-5678"
+    semantic_fail = "(광고) 설화수\n미백 크림\n고객센터 1588-1234\n무료수신거부 080-1234-5678"
+    rule_fail = "설화수 신제품 안내"
+    messages = [ok, rule_fail, semantic_fail, ok.replace("\n", "\n\n  ")]
+
+    verdicts = asyncio.run(agent.check_compliance_batch(messages, concurrency=2))
+
+    assert [v["status"] for v in verdicts] == ["PASS", "FAIL", "FAIL", "PASS"]
+    assert verdicts[0] == verdicts[3]
+    assert sorted(runs) == sorted([ok, semantic_fail])
+    assert embed_calls == [[ok.replace("\n", " "), semantic_fail.replace("\n", " ")]]
+
+def test_context_builder_ranks_dedupes_and_respects_budget():
+    from services.regulation_agent.retrieval import build_context, estimate_tokens
+
+    def hit(chunk_id, score, content):
+        return {"id": chunk_id, "score": score, "metadata": {"header": chunk_id, "content": content}}
+
+    spam = [hit("spam:1", 0.5, "가" * 100), hit("spam:2", 0.9, "나" * 100), hit("spam:1", 0.7, "가" * 100)]
+    cosmetics = [hit("cosmetics:0", 0.8, "다" * 100), hit("cosmetics:3", 0.1, "라" * 10)]
+
+    context = build_context(spam, cosmetics, token_budget=250)
+
+    # 0.9 and 0.8 fit (~110 tokens each); spam:1 (0.7) doesn't; the short 0.1 chunk still does
+    assert context["chunk_ids"] == ["spam:2", "cosmetics:0", "cosmetics:3"]
+    assert context["dropped"] == 1
+    assert context["tokens"] == estimate_tokens(context["text"])
+    assert "Regulation 1: Spam Prevention & IT Network Act (Total 1)" in context["text"]
+    assert "Regulation 2: Cosmetics Guidelines (Total 2)" in context["text"]
@@ -0,0 +1,31 @@
+import os
+import hashlib
+from typing import Dict, Any, List
+
+def files_sha256(paths: List[str]) -> str:
+    """Content hash over several files (missing files hash as empty)."""
+    h = hashlib.sha256()
+    for path in paths:
+        h.update(os.path.basename(path).encode("utf-8"))
+        if not os.path.exists(path):
+            continue
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()
+
+def files_fingerprint(paths: List[str]) -> Dict[str, Any]:
+    """Cheap (size, mtime) fingerprint used to skip hashing when nothing was touched."""
+    fp = {}
+    for path in paths:
+        if os.path.exists(path):
+            st = os.stat(path)
+            fp[os.path.basename(path)] = [st.st_size, st.st_mtime_ns]
+    return fp
+
+def is_fresh(manifest: Dict[str, Any], paths: List[str]) -> bool:
+    """True if a build manifest ({'source_fingerprint', 'source_sha256'}) still matches the sources."""
+    if manifest.get("source_fingerprint") == files_fingerprint(paths):
+        return True
+    # mtimes change on checkout/copy; fall back to the content hash
+    return manifest.get("source_sha256") == files_sha256(paths)
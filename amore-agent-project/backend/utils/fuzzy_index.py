@@ -0,0 +1,59 @@
+import re
+import math
+from collections import defaultdict
+from typing import Dict, List, Tuple, Iterable
+
+_STRIP_RE = re.compile(r"[^0-9a-z가-힣]+")
+
+def char_ngrams(text: str, n: int = 2) -> set:
+    """
+    Character n-grams over the normalized text (lowercase, spaces/punctuation removed).
+    A Hangul syllable is one character, so bigrams are syllable pairs ("자음생" -> 자음, 음생).
+    Texts shorter than n yield the text itself.
+    """
+    text = _STRIP_RE.sub("", text.lower())
+    if len(text) <= n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+class NgramIndex:
+    """
+    Inverted index from character n-grams to keys, scored by cosine over n-gram sets.
+    Built once; a search only touches the postings of the query's n-grams.
+    """
+    def __init__(self, items: Iterable[Tuple[str, str]] = (), n: int = 2):
+        self.n = n
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+        self.keys: List[str] = []
+        self.sizes: List[int] = []
+        for key, text in items:
+            self.add(key, text)
+
+    def add(self, key: str, text: str):
+        grams = char_ngrams(text, self.n)
+        doc_id = len(self.keys)
+        self.keys.append(key)
+        self.sizes.append(len(grams))
+        for gram in grams:
+            self.postings[gram].append(doc_id)
+
+    def search(self, query: str, k: int = 3, cutoff: float = 0.0) -> List[Tuple[str, float]]:
+        """Top-k (key, score) with score >= cutoff, best first. Score is |A∩B| / sqrt(|A||B|)."""
+        grams = char_ngrams(query, self.n)
+        if not grams:
+            return []
+        overlap: Dict[int, int] = defaultdict(int)
+        for gram in grams:
+            for doc_id in self.postings.get(gram, ()):
+                overlap[doc_id] += 1
+
+        scored = []
+        for doc_id, common in overlap.items():
+            score = common / math.sqrt(len(grams) * self.sizes[doc_id])
+            if score >= cutoff:
+                scored.append((round(score, 4), doc_id))
+        scored.sort(key=lambda x: (-x[0], x[1])) # ties keep insertion order
+        return [(self.keys[doc_id], score) for score, doc_id in scored[:k]]
+
+    def __len__(self):
+        return len(self.keys)
@@ -0,0 +1,119 @@
+"""
+Versioned snapshots of file-backed data that are rebuilt when their sources change.
+
+A HotReloader owns one immutable snapshot (DataLoader, ProductRetriever, regulation DBs, ...).
+  - get():   returns the current snapshot (built on first use). Readers grab the reference
+             once per request and keep using it, so a swap never affects in-flight work.
+  - check(): (size, mtime) fingerprint of the sources; on a change the content hash decides
+             whether to rebuild. The new snapshot is built completely, then published with a
+             single reference assignment, so nobody ever sees a half-built index.
+Builders that tolerate missing/corrupt files (and return an empty snapshot) pass `validate`,
+which raises on a snapshot that must not be served; the old snapshot then stays in place and
+the same broken sources are not rebuilt again until they change.
+  - start(): daemon thread calling check() every HOT_RELOAD_INTERVAL seconds.
+"""
+import os
+import threading
+import traceback
+from typing import Callable, Generic, List, Optional, TypeVar
+from utils.fingerprint import files_fingerprint, files_sha256
+
+# Seconds between source checks of the watcher threads (0 disables watching)
+HOT_RELOAD_INTERVAL = float(os.getenv("HOT_RELOAD_INTERVAL", "30"))
+
+T = TypeVar("T")
+
+_registry: List["HotReloader"] = []
+
+class HotReloader(Generic[T]):
+    def __init__(self, name: str, sources: List[str], build: Callable[[], T],
+                 validate: Optional[Callable[[T], None]] = None):
+        self.name = name
+        self.sources = list(sources)
+        self.build = build
+        self.validate = validate
+        self.version = 0 # Bumped on every swap
+        self._snapshot: Optional[T] = None
+        self._fingerprint = None
+        self._sha256 = None
+        self._rejected = None # Fingerprint of sources whose build failed validation
+        self._build_lock = threading.Lock() # One build at a time; readers never take it once loaded
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        _registry.append(self)
+
+    def get(self) -> T:
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._build_lock:
+                if self._snapshot is None:
+                    self._swap(*self._build())
+            snapshot = self._snapshot
+        return snapshot
+
+    @property
+    def loaded(self) -> bool:
+        return self._snapshot is not None
+
+    def _build(self):
+        # Fingerprint before building: an edit during the build is picked up by the next check
+        fingerprint, sha256 = files_fingerprint(self.sources), files_sha256(self.sources)
+        snapshot = self.build()
+        if self.validate is not None:
+            try:
+                self.validate(snapshot)
+            except Exception:
+                self._rejected = fingerprint
+                raise
+        return snapshot, fingerprint, sha256
+
+    def _swap(self, snapshot: T, fingerprint, sha256):
+        self._fingerprint, self._sha256 = fingerprint, sha256
+        self._snapshot = snapshot # Atomic reference swap
+        self.version += 1
+
+    def check(self) -> bool:
+        """Rebuild and swap if the sources changed since the current snapshot. Returns True on swap."""
+        if self._snapshot is None or files_fingerprint(self.sources) in (self._fingerprint, self._rejected):
+            return False
+        with self._build_lock:
+            fingerprint = files_fingerprint(self.sources)
+            if fingerprint in (self._fingerprint, self._rejected):
+                return False
+            if files_sha256(self.sources) == self._sha256:
+                # Touched but unchanged (checkout/copy): remember the new mtimes only
+                self._fingerprint = fingerprint
+                return False
+            print(f"[HotReload] {self.name}: sources changed, rebuilding...")
+            self._swap(*self._build())
+        print(f"[HotReload] {self.name}: swapped in version {self.version}")
+        return True
+
+    def _watch(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.check()
+            except Exception:
+                # A failed build or validation keeps the old snapshot serving; the sources are
+                # retried once they change again
+                print(f"[HotReload] {self.name}: rebuild failed, keeping version {self.version}")
+                traceback.print_exc()
+
+    def start(self, interval: float = HOT_RELOAD_INTERVAL):
+        if interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, args=(interval,), name=f"hot-reload-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+def start_watchers(interval: float = HOT_RELOAD_INTERVAL):
+    """Start a watcher thread for every registered snapshot."""
+    for reloader in _registry:
+        reloader.start(interval)
+
+def stop_watchers():
+    for reloader in _registry:
+        reloader.stop()
@@ -0,0 +1,216 @@
+import os
+import json
+import asyncio
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, List
+import numpy as np
+
+def make_cache_key(*parts: Any) -> str:
+    """Content-addressed key: sha256 over the JSON encoding of the parts."""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class LRUCache:
+    """Thread-safe in-memory LRU with optional TTL."""
+    def __init__(self, max_entries: int = 1024, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict() # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+class SQLiteCache:
+    """On-disk key/value tier with TTL and least-recently-used eviction."""
+    def __init__(self, path: str, ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value BLOB, expires_at REAL, last_used REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_used ON cache(last_used)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at < now:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE cache SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return value
+
+    def set(self, key: str, value: Any):
+        now = time.time()
+        expires_at = now + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now),
+            )
+            if self.max_entries:
+                # Evict the least recently used rows beyond the cap
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key IN ("
+                    " SELECT key FROM cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+class ResponseCache:
+    """
+    Two-tier cache: in-memory LRU in front of an optional SQLite store.
+    Disk hits are promoted into memory. Tracks hit/miss counters.
+    """
+    def __init__(self, max_entries: int = 1024, ttl_seconds: Optional[float] = None,
+                 db_path: Optional[str] = None, disk_max_entries: Optional[int] = None):
+        self.memory = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.disk = SQLiteCache(db_path, ttl_seconds=ttl_seconds, max_entries=disk_max_entries) if db_path else None
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.disk_hits += 1
+                self.memory.set(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """`get` for async callers: a memory miss reads the SQLite tier in a worker thread."""
+        if self.disk is None or self.memory.get(key) is not None:
+            return self.get(key)
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: Any):
+        """`set` for async callers: the SQLite write runs in a worker thread."""
+        if self.disk is None:
+            self.set(key, value)
+        else:
+            await asyncio.to_thread(self.set, key, value)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "memory_entries": len(self.memory),
+        }
+
+class EmbeddingCache:
+    """
+    Embedding vectors keyed by (model, normalized text), stored as float32 bytes
+    in a ResponseCache (memory LRU + optional SQLite tier with LRU eviction).
+    """
+    def __init__(self, max_entries: int = 4096, db_path: Optional[str] = None,
+                 disk_max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.store = ResponseCache(max_entries=max_entries, ttl_seconds=ttl_seconds,
+                                   db_path=db_path, disk_max_entries=disk_max_entries)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        # Whitespace/newline differences don't change what the query means
+        return " ".join(text.split())
+
+    def key(self, model: str, text: str) -> str:
+        return make_cache_key("embedding", model, self.normalize(text))
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        vectors = []
+        for text in texts:
+            blob = self.store.get(self.key(model, text))
+            vectors.append(np.frombuffer(blob, dtype=np.float32) if blob is not None else None)
+        return vectors
+
+    def set(self, model: str, text: str, vector) -> None:
+        self.store.set(self.key(model, text), np.asarray(vector, dtype=np.float32).tobytes())
+
+    async def aget_many(self, model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """`get_many` for async callers (one worker-thread hop when the SQLite tier is on)."""
+        if self.store.disk is None:
+            return self.get_many(model, texts)
+        return await asyncio.to_thread(self.get_many, model, texts)
+
+    async def aset_many(self, model: str, vectors: dict) -> None:
+        """Store {text: vector}; the SQLite writes run in a worker thread."""
+        def write():
+            for text, vector in vectors.items():
+                self.set(model, text, vector)
+        if self.store.disk is None:
+            write()
+        else:
+            await asyncio.to_thread(write)
+
+    def stats(self) -> dict:
+        return self.store.stats()
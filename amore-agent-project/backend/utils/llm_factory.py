@@ -1,51 +1,222 @@
 import os
+import asyncio
+import threading
 import openai
-from typing import Optional
+from typing import Optional, List, AsyncIterator
 from dotenv import load_dotenv
+from utils.llm_cache import ResponseCache, make_cache_key
 
 # Load .env from backend directory (where this script runs or parent)
 load_dotenv()
 
+# Connection pool & concurrency limits (shared by every agent in the process)
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "16"))      # Max concurrent API calls
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))  # Hard cap on open sockets
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "16"))      # Idle keep-alive sockets kept for reuse
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))                # Default per-call timeout (seconds)
+
+# Response cache (memory LRU + optional SQLite tier)
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))          # In-memory entries
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB")                           # e.g. ./.cache/llm_cache.sqlite (unset = memory only)
+
+MOCK_RESPONSE = "[MOCK RESPONSE] OpenAI API Key가 설정되지 않았습니다. .env 파일에 OPENAI_API_KEY를 넣어주세요.\n(하지만 엔진 연결은 성공했습니다!)"
+
+def _build_http_client():
+    """Keep-alive pooled HTTP client so TCP/TLS setup is reused across calls."""
+    import httpx
+    return openai.DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE,
+        ),
+        timeout=LLM_TIMEOUT,
+    )
+
 class LLMClient:
-    def __init__(self, api_key: Optional[str] = None, model: str = "gpt-4o-mini"):
+    def __init__(self, api_key: Optional[str] = None, model: str = "gpt-4o-mini",
+                 max_in_flight: int = LLM_MAX_IN_FLIGHT, timeout: float = LLM_TIMEOUT,
+                 cache: Optional[ResponseCache] = None):
         # Try to get key from args, then env, then maybe a hardcoded place if for dev (not recommended)
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
-        self.client = None
         self.model = model
-        
-        if self.api_key:
-            self.client = openai.OpenAI(api_key=self.api_key)
-        else:
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        # Pooled client + semaphore are bound to an event loop, so they are created lazily
+        # inside the running loop (see _bind_loop), not when this process-wide singleton is built
+        self.client = None # May also be injected (tests, custom transports); never replaced then
+        self._own_client = None # The client _bind_loop built, rebuilt per loop
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+        self.cache = cache or ResponseCache(
+            max_entries=LLM_CACHE_SIZE, ttl_seconds=LLM_CACHE_TTL, db_path=LLM_CACHE_DB
+        )
+        # Token usage reported by the API (cached_tokens = prompt prefix served from the provider's cache)
+        self.usage = {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+
+        if not self.api_key:
             print("[LLMClient] Warning: OPENAI_API_KEY not found. Responses will be mocked.")
 
-    def generate(self, prompt: str, system_message: str = None) -> str:
-        if not self.client:
-             return "[MOCK RESPONSE] OpenAI API Key가 설정되지 않았습니다. .env 파일에 OPENAI_API_KEY를 넣어주세요.\n(하지만 엔진 연결은 성공했습니다!)"
+    def _bind_loop(self):
+        """Create the pooled client and in-flight semaphore for the running loop (again if the loop changed)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        # Bounds in-flight requests so bursts queue here instead of opening unbounded sockets
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        if self.api_key and (self.client is None or self.client is self._own_client):
+            # A client left over from a previous (closed) loop can't be closed from here; it is dropped
+            self.client = self._own_client = openai.AsyncOpenAI(
+                api_key=self.api_key,
+                http_client=_build_http_client(),
+                timeout=self.timeout,
+            )
+
+    @property
+    def available(self) -> bool:
+        return bool(self.api_key) or self.client is not None
 
+    def _build_messages(self, prompt: str, system_message: str = None) -> list:
         messages = []
         if system_message:
             messages.append({"role": "system", "content": system_message})
-        
-        # In our prompt structure, 'prompt' often contains system directives. 
-        # If so, we can just treat it as user message or split it. 
+
+        # In our prompt structure, 'prompt' often contains system directives.
+        # If so, we can just treat it as user message or split it.
         # For simplicity, we send the whole chunk as user message if system_message is empty.
         messages.append({"role": "user", "content": prompt})
+        return messages
+
+    async def complete(self, prompt: str, system_message: str = None, model: str = None,
+                       temperature: float = 0.7, max_tokens: Optional[int] = 600,
+                       timeout: Optional[float] = None, cache: Optional[bool] = None) -> str:
+        """
+        Chat completion. Raises on API errors (use `generate` for the forgiving variant).
+        `cache`: None -> cache only deterministic (temperature 0) calls, True/False to force.
+        """
+        self._bind_loop()
+        if not self.client:
+             return MOCK_RESPONSE
+
+        messages = self._build_messages(prompt, system_message)
+        model = model or self.model
+        use_cache = (temperature == 0) if cache is None else cache
+        cache_key = make_cache_key(model, system_message, prompt, temperature, max_tokens)
+        if use_cache:
+            cached = await self.cache.aget(cache_key)
+            if cached is not None:
+                return cached
+
+        params = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "timeout": timeout or self.timeout,
+        }
+        if max_tokens is not None:
+            params["max_tokens"] = max_tokens  # Smaller limit for cost control
+
+        async with self._semaphore:
+            response = await self.client.chat.completions.create(**params)
+        self._record_usage(getattr(response, "usage", None))
+        content = response.choices[0].message.content
+        if use_cache and content:
+            await self.cache.aset(cache_key, content)
+        return content
+
+    def _record_usage(self, usage):
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.usage["calls"] += 1
+        self.usage["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+        self.usage["cached_tokens"] += (getattr(details, "cached_tokens", 0) or 0) if details else 0
+        self.usage["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
 
+    def usage_stats(self) -> dict:
+        """Cumulative token usage; cached_ratio is the share of prompt tokens billed at the cached rate."""
+        prompt_tokens = self.usage["prompt_tokens"]
+        return {
+            **self.usage,
+            "cached_ratio": round(self.usage["cached_tokens"] / prompt_tokens, 4) if prompt_tokens else 0.0,
+        }
+
+    async def generate(self, prompt: str, system_message: str = None, **kwargs) -> str:
+        """Same as `complete`, but API failures are returned as a readable message."""
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=600  # Smaller limit for cost control
-            )
-            return response.choices[0].message.content
+            return await self.complete(prompt, system_message=system_message, **kwargs)
         except Exception as e:
             return f"❌ OpenAI API 호출 실패: {str(e)}"
 
+    async def stream(self, prompt: str, system_message: str = None, model: str = None,
+                     temperature: float = 0.7, max_tokens: Optional[int] = 600,
+                     timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """Streamed chat completion: yields text deltas as tokens arrive. Raises on API errors."""
+        self._bind_loop()
+        if not self.client:
+            yield MOCK_RESPONSE
+            return
+
+        params = {
+            "model": model or self.model,
+            "messages": self._build_messages(prompt, system_message),
+            "temperature": temperature,
+            "timeout": timeout or self.timeout,
+            "stream": True,
+        }
+        if max_tokens is not None:
+            params["max_tokens"] = max_tokens
+
+        async with self._semaphore:
+            response = await self.client.chat.completions.create(**params)
+            # Closing the stream releases the pooled connection, also when the consumer stops early
+            # (client disconnect -> task cancelled -> this generator is closed)
+            async with response:
+                async for chunk in response:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+
+    async def generate_stream(self, prompt: str, system_message: str = None, **kwargs) -> AsyncIterator[str]:
+        """Same as `stream`, but an API failure is yielded as a readable message."""
+        try:
+            async for delta in self.stream(prompt, system_message=system_message, **kwargs):
+                yield delta
+        except Exception as e:
+            yield f"❌ OpenAI API 호출 실패: {str(e)}"
+
+    async def embed(self, texts: List[str], model: str = "text-embedding-3-small",
+                    timeout: Optional[float] = None) -> List[List[float]]:
+        """Embed a list of texts in a single request (order preserved)."""
+        self._bind_loop()
+        if not self.client:
+            raise RuntimeError("OPENAI_API_KEY is not set. Embeddings are unavailable.")
+
+        async with self._semaphore:
+            response = await self.client.embeddings.create(
+                input=texts, model=model, timeout=timeout or self.timeout
+            )
+        return [item.embedding for item in response.data]
+
+    def cache_stats(self) -> dict:
+        return self.cache.stats()
+
+    async def aclose(self):
+        """Release pooled connections (call on app shutdown)."""
+        if self.client and self._loop is asyncio.get_running_loop():
+            await self.client.close()
+        self._loop = None
+
 # Singleton
 _client_instance = None
+_client_lock = threading.Lock() # Agents are constructed from worker threads
 def get_llm_client():
     global _client_instance
     if _client_instance is None:
-        _client_instance = LLMClient()
+        with _client_lock:
+            if _client_instance is None:
+                _client_instance = LLMClient()
     return _client_instance
@@ -402,6 +402,8 @@ with col_right:
             top_product = products[0] if products else {}
             top_persona = (candidates.get("personas") or ["미지정"])[0]
             top_purpose = (candidates.get("purposes") or ["-"])[0]
+            persona_scores = candidates.get("persona_scores") or []
+            persona_match = f" · 일치도 {persona_scores[0]:.0%}" if persona_scores and persona_scores[0] else ""
             detected_brand = candidates.get("detected_brand", "Unknown")
             brand_tone = candidates.get("brand_tone", "Default")
             
@@ -426,7 +428,7 @@ with col_right:
                     st.markdown(f"""
                     <div style="background:#fff; border:none; border-radius:16px; padding:12px 20px; margin-bottom:8px; box-shadow: 0 2px 8px rgba(3, 27, 87, 0.05);">
                         <div style="color:#000000; font-size:0.75rem; margin-bottom:2px; opacity:0.6;">🎯 타겟 페르소나</div>
-                        <div style="font-weight:700; color:#000000; font-size:0.95rem; line-height:1.2;">{top_persona}</div>
+                        <div style="font-weight:700; color:#000000; font-size:0.95rem; line-height:1.2;">{top_persona}<span style="font-weight:400; font-size:0.75rem; opacity:0.6;">{persona_match}</span></div>
                         <div style="font-size:0.8rem; color:#000000; margin-top:2px;">{top_purpose}</div>
                     </div>""", unsafe_allow_html=True)
 
@@ -520,6 +522,9 @@ with col_right:
     # 3. Input Area (Fixed at bottom via Layout order)
     # -------------------------------------------------------------------------
     
+    # Placeholder for the streamed draft message (rendered token by token)
+    draft_container = st.empty()
+
     # Placeholder for spinner/loading state ABOVE the input
     loading_container = st.empty()
 
@@ -571,6 +576,20 @@ with col_right:
                 """
                 return html
 
+            # Helper to render the in-progress draft as a chat bubble
+            def render_draft_bubble(draft_text):
+                html = f"""
+                <div style="display:flex; justify-content:flex-start; margin-bottom:1.5rem;">
+                    <div style="background-color:#F5F9FF; padding:20px; border-radius:4px 24px 24px 24px; max-width:85%; box-shadow: 0 2px 12px rgba(3, 27, 87, 0.04);">
+                        <div style="font-weight:700; color:#2848FC; margin-bottom:8px; display:flex; align-items:center; gap:6px;">
+                            <span>🤖</span> 작성 중...
+                        </div>
+                        <div style="white-space: pre-wrap; line-height:1.6; color:#031B57;">{draft_text}</div>
+                    </div>
+                </div>
+                """
+                return html
+
             try:
                 full_prompt = f"[{channel}] {user_input}"
                 if tone != "기본":
@@ -600,6 +619,7 @@ with col_right:
                         }
                         
                         current_status_msg = "연결 중..."
+                        draft_text = ""
                         status_container.markdown(render_status_bubble(current_status_msg), unsafe_allow_html=True)
                         
                         for line in response.iter_lines():
@@ -616,6 +636,11 @@ with col_right:
                                             current_status_msg = event.get("msg", "...")
                                             status_container.markdown(render_status_bubble(current_status_msg), unsafe_allow_html=True)
                                             
+                                        elif evt_type == "delta":
+                                            # Render the draft incrementally as tokens arrive
+                                            draft_text += event.get("value", "")
+                                            draft_container.markdown(render_draft_bubble(draft_text), unsafe_allow_html=True)
+                                            
                                         elif evt_type == "data":
                                             key = event.get("key")
                                             val = event.get("value")
@@ -648,6 +673,7 @@ with col_right:
                         
                         # Stream Finished
                         status_container.empty() # Remove status bar
+                        draft_container.empty() # Final message is rendered by the history loop
                         
                         # Update Suggestions for Next Turn
                         if "suggestions" in collected_data: